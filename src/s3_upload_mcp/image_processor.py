@@ -4,31 +4,593 @@ Image Processing Module for MCP Server
 Handles image optimization, format conversion, and file processing.
 """
 
+import io
 import os
+import re
+import shutil
+import string
+import threading
 import logging
-from typing import Optional, Tuple, Dict, Any
+import multiprocessing
+from typing import Any, BinaryIO, Dict, Optional, Tuple, Union
 from pathlib import Path
-from PIL import Image, ImageOps
+from PIL import Image, ImageOps, __version__ as PILLOW_VERSION
 import asyncio
+from concurrent.futures import ProcessPoolExecutor
+
+from .utils import bounded_map, file_digest, file_suffix
+
+try:
+    import mozjpeg_lossless_optimization
+except ImportError:  # Optional: pip install s3-upload-mcp-server[mozjpeg]
+    mozjpeg_lossless_optimization = None
 
 logger = logging.getLogger(__name__)
 
+# Characters kept by normalize_filename; everything else becomes "_"
+_SAFE_FILENAME_CHARS = frozenset(string.ascii_letters + string.digits + '-_.')
+_UNDERSCORE_RE = re.compile(r'_+')
+
+
+class _UnsafeCharTable(dict):
+    """str.translate table mapping any unsafe character to "_" (memoized)."""
+    
+    def __missing__(self, codepoint: int) -> int:
+        value = codepoint if chr(codepoint) in _SAFE_FILENAME_CHARS else ord('_')
+        self[codepoint] = value
+        return value
+
+
+_FILENAME_TABLE = _UnsafeCharTable()
+
+
+# Image.info entries that carry EXIF, XMP, IPTC, ICC or comment payloads
+_METADATA_KEYS = ('exif', 'xmp', 'XML:com.adobe.xmp', 'photoshop', 'icc_profile', 'comment')
+
+# JPEG segments dropped by _strip_jpeg: APP1 (EXIF/XMP), APP2 (ICC),
+# APP13 (IPTC) and COM
+_JPEG_METADATA_MARKERS = frozenset({0xE1, 0xE2, 0xED, 0xFE})
+
+# PNG chunks dropped by _strip_png
+_PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+_PNG_METADATA_CHUNKS = frozenset({b'eXIf', b'iCCP', b'tEXt', b'zTXt', b'iTXt', b'tIME'})
+
+# In-memory output must be below this fraction of the input size to be
+# kept over the original (see _process_image_bytes)
+_MIN_SIZE_RATIO = 0.95
+
+# Lazily created pool for CPU-bound image work (see _get_image_pool)
+_IMG_POOL: Optional[ProcessPoolExecutor] = None
+
+
+def _get_image_pool() -> ProcessPoolExecutor:
+    """Return the shared process pool, creating it on first use."""
+    global _IMG_POOL
+    if _IMG_POOL is None:
+        # The pool starts after boto3/CRT and executor threads are running;
+        # forking then can copy locks held by those threads into workers,
+        # so workers come from a clean forkserver (spawn where unsupported)
+        start_method = (
+            'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        )
+        _IMG_POOL = ProcessPoolExecutor(
+            max_workers=os.cpu_count(),
+            mp_context=multiprocessing.get_context(start_method)
+        )
+    return _IMG_POOL
+
+
+def _shutdown_image_pool() -> None:
+    """Stop the shared process pool; the next use creates a new one."""
+    global _IMG_POOL
+    if _IMG_POOL is not None:
+        _IMG_POOL.shutdown()
+        _IMG_POOL = None
+
+
+def _resize_image(img: Image.Image, max_width: int, max_height: int) -> Image.Image:
+    """
+    Resize image while maintaining aspect ratio.
+    
+    Args:
+        img: PIL Image object
+        max_width: Maximum width
+        max_height: Maximum height
+        
+    Returns:
+        PIL Image object (resized if necessary)
+    """
+    if img.width <= max_width and img.height <= max_height:
+        return img
+    
+    # Calculate new dimensions maintaining aspect ratio
+    ratio = min(max_width / img.width, max_height / img.height)
+    new_width = int(img.width * ratio)
+    new_height = int(img.height * ratio)
+    
+    return img.resize((new_width, new_height), Image.Resampling.LANCZOS)
+
+
+def _encode_image(
+    file_path: str,
+    target: Union[str, BinaryIO],
+    suffix: str,
+    quality: int,
+    max_width: int,
+    max_height: int,
+    convert_to_webp: bool
+) -> bool:
+    """
+    Decode, orient, resize and re-encode an image into target.
+    
+    Args:
+        file_path: Path to the input image
+        target: Output path or writable binary file object
+        suffix: Output file extension, used to pick the encoder
+        quality: Compression quality (1-100)
+        max_width: Maximum width for resizing
+        max_height: Maximum height for resizing
+        convert_to_webp: Whether to encode as WebP
+        
+    Returns:
+        bool: True if the output was encoded as JPEG
+    """
+    with Image.open(file_path) as img:
+        # Let libjpeg do a scaled IDCT for very large JPEGs;
+        # LANCZOS below still produces the exact final size
+        if img.format == 'JPEG' and (
+            img.width > max_width * 2 or img.height > max_height * 2
+        ):
+            img.draft(img.mode, (max_width * 2, max_height * 2))
+        
+        # Handle EXIF orientation before resizing so max_width/max_height
+        # apply to the upright image; skip the copy for upright images
+        if img.getexif().get(0x0112, 1) != 1:
+            img = ImageOps.exif_transpose(img)
+        
+        # Convert to RGB if necessary (for JPEG/WebP)
+        if convert_to_webp and img.mode == 'RGBA':
+            alpha = img.getchannel('A')
+            if alpha.getextrema() == (255, 255):
+                # Fully opaque (typical of exports): no composite needed
+                img = img.convert('RGB')
+            else:
+                # Create white background for transparency
+                background = Image.new('RGB', img.size, (255, 255, 255))
+                background.paste(img, mask=alpha)
+                img = background
+        elif convert_to_webp and img.mode == 'LA':
+            background = Image.new('RGB', img.size, (255, 255, 255))
+            background.paste(img)
+            img = background
+        elif convert_to_webp and img.mode != 'RGB':
+            img = img.convert('RGB')
+        
+        # Resize if necessary
+        img = _resize_image(img, max_width, max_height)
+        
+        # Save with optimization
+        save_kwargs = {
+            'optimize': True,
+            'quality': quality
+        }
+        
+        if convert_to_webp:
+            image_format = 'WEBP'
+        else:
+            image_format = Image.registered_extensions().get(suffix.lower(), img.format)
+        is_jpeg = image_format == 'JPEG'
+        
+        if is_jpeg:
+            save_kwargs['progressive'] = True
+        img.save(target, image_format, **save_kwargs)
+    
+    return is_jpeg
+
+
+def _process_image(
+    file_path: str,
+    output_path: str,
+    quality: int,
+    max_width: int,
+    max_height: int,
+    convert_to_webp: bool
+) -> str:
+    """
+    Optimize a single image synchronously.
+    
+    Kept at module level so it can be pickled into worker processes.
+    
+    Returns:
+        str: Path to the optimized image
+    """
+    # Never write through a hardlink left behind by a skipped optimization
+    if os.path.abspath(output_path) != os.path.abspath(file_path) and os.path.lexists(output_path):
+        os.remove(output_path)
+    
+    if os.getenv('USE_VIPS'):
+        return _process_image_vips(
+            file_path, output_path, quality, max_width, max_height, convert_to_webp
+        )
+    
+    is_jpeg = _encode_image(
+        file_path, output_path, Path(output_path).suffix,
+        quality, max_width, max_height, convert_to_webp
+    )
+    
+    # Losslessly re-encode with MozJPEG's optimized progressive scans
+    # when available; pixels are untouched
+    if is_jpeg and mozjpeg_lossless_optimization:
+        with open(output_path, 'rb') as f:
+            jpeg_bytes = f.read()
+        with open(output_path, 'wb') as f:
+            f.write(mozjpeg_lossless_optimization.optimize(jpeg_bytes))
+        
+    return output_path
+
+
+def _process_image_bytes(
+    file_path: str,
+    quality: int,
+    max_width: int,
+    max_height: int,
+    convert_to_webp: bool
+) -> bytes:
+    """
+    Optimize a single image synchronously into memory.
+    
+    The output keeps the input's format unless converting to WebP. When
+    re-encoding did not make an upright, in-bounds image meaningfully
+    smaller, the original bytes (with metadata stripped) are returned
+    instead.
+    Kept at module level so it can be pickled into worker processes.
+    
+    Returns:
+        bytes: Encoded optimized image
+    """
+    suffix = '.webp' if convert_to_webp else Path(file_path).suffix
+    
+    if os.getenv('USE_VIPS'):
+        image, options = _vips_thumbnail(
+            file_path, suffix, quality, max_width, max_height, convert_to_webp
+        )
+        image_bytes = image.write_to_buffer(suffix, **options)
+    else:
+        # A fresh buffer per image: CPython's BytesIO.truncate() releases its
+        # storage, getvalue() copies unless the buffer is exactly full, and the
+        # result is pickled back to the parent anyway, so pooling buffers here
+        # would save no allocations
+        buffer = io.BytesIO()
+        is_jpeg = _encode_image(
+            file_path, buffer, suffix, quality, max_width, max_height, convert_to_webp
+        )
+        image_bytes = buffer.getvalue()
+        
+        if is_jpeg and mozjpeg_lossless_optimization:
+            image_bytes = mozjpeg_lossless_optimization.optimize(image_bytes)
+    
+    # Already-compressed inputs often come out no smaller (or larger);
+    # keep the original when it needs no resize, rotation or conversion,
+    # minus the metadata that re-encoding would have dropped
+    if not convert_to_webp and _fits_as_is(file_path, max_width, max_height):
+        original = _read_without_metadata(file_path)
+        if original is not None and len(image_bytes) >= len(original) * _MIN_SIZE_RATIO:
+            return original
+    
+    return image_bytes
+
+
+def _read_without_metadata(file_path: str) -> Optional[bytes]:
+    """
+    Read an image file with its metadata payloads removed.
+    
+    JPEG and PNG files are stripped without touching their compressed
+    image data; other formats are returned only if they carry no metadata.
+    
+    Returns:
+        bytes: File contents free of metadata, or None if they cannot be
+        stripped losslessly
+    """
+    with open(file_path, 'rb') as f:
+        data = f.read()
+    
+    if data.startswith(b'\xff\xd8'):
+        return _strip_jpeg(data)
+    if data.startswith(_PNG_SIGNATURE):
+        return _strip_png(data)
+    
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            return None if _carries_metadata(img) else data
+    except Exception:
+        return None
+
+
+def _strip_jpeg(data: bytes) -> Optional[bytes]:
+    """
+    Drop EXIF, XMP, ICC, IPTC and comment segments from a JPEG.
+    
+    Returns:
+        bytes: The stripped JPEG, or None if its header is malformed
+    """
+    parts = [data[:2]]
+    pos = 2
+    while pos + 4 <= len(data):
+        if data[pos] != 0xFF:
+            return None
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            # Fill byte before a marker
+            pos += 1
+            continue
+        if marker in (0xDA, 0xD9):
+            # Start of scan (or end of image): the rest is image data
+            parts.append(data[pos:])
+            return b''.join(parts)
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+            # Standalone markers have no length field
+            parts.append(data[pos:pos + 2])
+            pos += 2
+            continue
+        end = pos + 2 + int.from_bytes(data[pos + 2:pos + 4], 'big')
+        if end > len(data):
+            return None
+        if marker not in _JPEG_METADATA_MARKERS:
+            parts.append(data[pos:end])
+        pos = end
+    return None
+
+
+def _strip_png(data: bytes) -> Optional[bytes]:
+    """
+    Drop EXIF, ICC, text and timestamp chunks from a PNG.
+    
+    Returns:
+        bytes: The stripped PNG, or None if its chunks are malformed
+    """
+    parts = [_PNG_SIGNATURE]
+    pos = len(_PNG_SIGNATURE)
+    while pos + 12 <= len(data):
+        chunk_type = data[pos + 4:pos + 8]
+        end = pos + 12 + int.from_bytes(data[pos:pos + 4], 'big')
+        if end > len(data):
+            return None
+        if chunk_type not in _PNG_METADATA_CHUNKS:
+            parts.append(data[pos:end])
+        if chunk_type == b'IEND':
+            return b''.join(parts)
+        pos = end
+    return None
+
+
+def _fits_as_is(
+    file_path: str,
+    max_width: int,
+    max_height: int,
+    require_plain: bool = False
+) -> bool:
+    """
+    Check whether an image is upright and within bounds.
+    
+    Only the file header is read; pixel data is never decoded.
+    
+    Args:
+        file_path: Path to the input image
+        max_width: Maximum width
+        max_height: Maximum height
+        require_plain: Also require the file to carry no metadata payloads;
+            re-encoding drops them, so an as-is upload would leak them
+    
+    Returns:
+        bool: True if the image needs no resize or EXIF rotation
+    """
+    try:
+        with Image.open(file_path) as img:
+            exif = img.getexif()
+            if (
+                img.width > max_width
+                or img.height > max_height
+                or exif.get(0x0112, 1) != 1
+            ):
+                return False
+            return not require_plain or not _carries_metadata(img, exif)
+    except Exception:
+        return False
+
+
+def _carries_metadata(img: Image.Image, exif: Optional[Image.Exif] = None) -> bool:
+    """Check whether an opened image has EXIF, XMP, IPTC, ICC or comment data."""
+    if exif is None:
+        exif = img.getexif()
+    return len(exif) > 0 or any(img.info.get(key) for key in _METADATA_KEYS)
+
+
+def _process_image_vips(
+    file_path: str,
+    output_path: str,
+    quality: int,
+    max_width: int,
+    max_height: int,
+    convert_to_webp: bool
+) -> str:
+    """
+    Optimize a single image with libvips (optional backend, USE_VIPS=1).
+    
+    Returns:
+        str: Path to the optimized image
+    """
+    image, options = _vips_thumbnail(
+        file_path, Path(output_path).suffix, quality, max_width, max_height, convert_to_webp
+    )
+    
+    if convert_to_webp:
+        image.webpsave(output_path, **options)
+    else:
+        image.write_to_file(output_path, **options)
+    
+    return output_path
+
+
+def _vips_thumbnail(
+    file_path: str,
+    suffix: str,
+    quality: int,
+    max_width: int,
+    max_height: int,
+    convert_to_webp: bool
+) -> Tuple[Any, Dict[str, Any]]:
+    """
+    Load and shrink an image with libvips and choose its saver options.
+    
+    thumbnail() fuses decode, shrink-on-load, resize and EXIF rotation into
+    one streaming pipeline, so large sources are never fully decoded.
+    
+    Returns:
+        tuple: (pyvips.Image, keyword arguments for the saver)
+    """
+    import pyvips  # Optional: pip install s3-upload-mcp-server[vips]
+    
+    image = pyvips.Image.thumbnail(
+        file_path, max_width, height=max_height, size='down', crop='none'
+    )
+    
+    if convert_to_webp:
+        if image.hasalpha():
+            image = image.flatten(background=[255, 255, 255])
+        return image, {'Q': quality, 'strip': True}
+    if suffix.lower() in ('.jpg', '.jpeg'):
+        return image, {'Q': quality, 'strip': True, 'optimize_coding': True, 'interlace': True}
+    return image, {'strip': True}
+
+
+def _backend() -> str:
+    """Name the encoder stack, so cached outputs are not reused across backends."""
+    if os.getenv('USE_VIPS'):
+        return 'vips'
+    if mozjpeg_lossless_optimization:
+        return f'pillow-{PILLOW_VERSION}+mozjpeg'
+    return f'pillow-{PILLOW_VERSION}'
+
+
+def _copy_cached(cache_path: str, dst: str) -> None:
+    """Copy a cache entry to dst, marking it recently used (see _prune_cache)."""
+    os.utime(cache_path)
+    _copy_file(cache_path, dst)
+
+
+def _read_cached(cache_path: str) -> bytes:
+    """Read a cache entry, marking it recently used (see _prune_cache)."""
+    os.utime(cache_path)
+    with open(cache_path, 'rb') as f:
+        return f.read()
+
+
+def _prune_cache(cache_dir: str, max_bytes: int) -> None:
+    """
+    Delete least recently used cache entries until the cache fits max_bytes.
+    
+    Entries are ordered by mtime, which every cache hit refreshes.
+    """
+    entries = []
+    total = 0
+    with os.scandir(cache_dir) as it:
+        for entry in it:
+            if entry.name.endswith('.tmp') or not entry.is_file(follow_symlinks=False):
+                continue
+            stat = entry.stat(follow_symlinks=False)
+            entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+            total += stat.st_size
+    
+    entries.sort()
+    for _, size, path in entries:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass  # Pruned concurrently by another worker
+        total -= size
+
+
+def _link_or_copy(src: str, dst: str) -> None:
+    """Hardlink src to dst, falling back to a copy (e.g. across filesystems)."""
+    if os.path.abspath(src) == os.path.abspath(dst):
+        return
+    try:
+        if os.path.exists(dst):
+            os.remove(dst)
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+def _write_file(dst: str, data: bytes) -> None:
+    """Write data to dst atomically (see _copy_file)."""
+    tmp_path = f"{dst}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, dst)
+
+
+def _copy_file(src: str, dst: str) -> None:
+    """
+    Copy src to dst atomically.
+    
+    The copy lands under a temporary name and is renamed into place, so
+    readers never see a partial file and existing hardlinks are not
+    written through.
+    """
+    tmp_path = f"{dst}.{os.getpid()}.{threading.get_ident()}.tmp"
+    shutil.copyfile(src, tmp_path)
+    os.replace(tmp_path, dst)
+
 
 class ImageProcessor:
     """Image processing utilities for the MCP server."""
     
     # Supported image formats
-    SUPPORTED_FORMATS = {'.png', '.jpg', '.jpeg', '.gif', '.webp', '.bmp', '.tiff', '.svg'}
+    SUPPORTED_FORMATS = frozenset({'.png', '.jpg', '.jpeg', '.gif', '.webp', '.bmp', '.tiff', '.svg'})
     
     # Default optimization settings
     DEFAULT_QUALITY = 80
     DEFAULT_MAX_WIDTH = 1920
     DEFAULT_MAX_HEIGHT = 1080
     
-    def __init__(self):
-        """Initialize the image processor."""
+    # Inputs smaller than this that need no resize are not re-encoded
+    SKIP_THRESHOLD = 200 * 1024
+    
+    # Least recently used cache entries are evicted above this total size
+    DEFAULT_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+    
+    def __init__(self, cache_dir: Optional[str] = None, cache_max_bytes: Optional[int] = None):
+        """
+        Initialize the image processor.
+        
+        Args:
+            cache_dir: Directory for caching optimized outputs by content hash
+                (defaults to S3_UPLOAD_CACHE_DIR; caching is off if unset)
+            cache_max_bytes: Size cap for cache_dir (defaults to
+                S3_UPLOAD_CACHE_MAX_BYTES, else 1GB)
+        """
+        self.cache_dir = cache_dir or os.getenv('S3_UPLOAD_CACHE_DIR')
+        self.cache_max_bytes = cache_max_bytes or int(
+            os.getenv('S3_UPLOAD_CACHE_MAX_BYTES', self.DEFAULT_CACHE_MAX_BYTES)
+        )
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
         logger.info("Image processor initialized")
     
+    async def __aenter__(self) -> "ImageProcessor":
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.close()
+    
+    async def close(self) -> None:
+        """Shut down the worker processes used for optimization."""
+        await asyncio.get_running_loop().run_in_executor(None, _shutdown_image_pool)
+        logger.info("Image processor closed")
+    
     def is_supported_format(self, file_path: str) -> bool:
         """
         Check if the file format is supported.
@@ -39,8 +601,7 @@ class ImageProcessor:
         Returns:
             bool: True if format is supported
         """
-        extension = Path(file_path).suffix.lower()
-        return extension in self.SUPPORTED_FORMATS
+        return file_suffix(file_path) in self.SUPPORTED_FORMATS
     
     def get_image_info(self, file_path: str) -> Dict[str, Any]:
         """
@@ -53,17 +614,20 @@ class ImageProcessor:
             dict: Image information including dimensions, format, size
         """
         try:
+            file_size = os.stat(file_path).st_size
+            # Only header fields are read here; pixel data is never decoded
             with Image.open(file_path) as img:
+                mode = img.mode
                 return {
                     'width': img.width,
                     'height': img.height,
                     'format': img.format,
-                    'mode': img.mode,
-                    'size_bytes': os.path.getsize(file_path),
-                    'has_transparency': img.mode in ('RGBA', 'LA') or 'transparency' in img.info
+                    'mode': mode,
+                    'size_bytes': file_size,
+                    'has_transparency': mode in ('RGBA', 'LA', 'PA') or 'transparency' in img.info
                 }
         except Exception as e:
-            logger.error(f"Error getting image info for {file_path}: {e}")
+            logger.error("Error getting image info for %s: %s", file_path, e)
             return {}
     
     async def optimize_image(
@@ -87,9 +651,20 @@ class ImageProcessor:
             convert_to_webp: Whether to convert to WebP format
             
         Returns:
-            str: Path to the optimized image
+            str: Path to the optimized image (the input path itself when the
+            input is already small enough, carries no metadata and no
+            output_path was requested)
         """
         try:
+            # Small, correctly sized and oriented inputs gain nothing from
+            # a decode/encode round-trip
+            if not convert_to_webp and self._can_skip_optimization(file_path, max_width, max_height):
+                if not output_path:
+                    logger.info("Skipping optimization for already small image: %s", file_path)
+                    return file_path
+                _link_or_copy(file_path, output_path)
+                return output_path
+            
             # Generate output path if not provided
             if not output_path:
                 input_path = Path(file_path)
@@ -98,52 +673,142 @@ class ImageProcessor:
                 else:
                     output_path = str(input_path.with_suffix(f'.optimized{input_path.suffix}'))
             
-            # Process image in executor to avoid blocking
-            def process_image():
-                with Image.open(file_path) as img:
-                    # Convert to RGB if necessary (for JPEG/WebP)
-                    if convert_to_webp and img.mode in ('RGBA', 'LA'):
-                        # Create white background for transparency
-                        background = Image.new('RGB', img.size, (255, 255, 255))
-                        if img.mode == 'RGBA':
-                            background.paste(img, mask=img.split()[-1])
-                        else:
-                            background.paste(img)
-                        img = background
-                    elif convert_to_webp and img.mode != 'RGB':
-                        img = img.convert('RGB')
-                    
-                    # Resize if necessary
-                    img = self._resize_image(img, max_width, max_height)
-                    
-                    # Optimize
-                    img = ImageOps.exif_transpose(img)  # Handle EXIF orientation
-                    
-                    # Save with optimization
-                    save_kwargs = {
-                        'optimize': True,
-                        'quality': quality
-                    }
-                    
-                    if convert_to_webp:
-                        img.save(output_path, 'WEBP', **save_kwargs)
-                    else:
-                        img.save(output_path, **save_kwargs)
-                
-                return output_path
+            loop = asyncio.get_running_loop()
+            
+            # Identical inputs with identical settings and backend reuse a
+            # cached output
+            cache_path = None
+            if self.cache_dir:
+                digest = await loop.run_in_executor(
+                    None, file_digest, file_path, 'file', _backend(),
+                    quality, max_width, max_height, convert_to_webp
+                )
+                cache_path = os.path.join(self.cache_dir, digest + Path(output_path).suffix)
+                try:
+                    await loop.run_in_executor(None, _copy_cached, cache_path, output_path)
+                except FileNotFoundError:
+                    pass
+                else:
+                    logger.info("Reused cached optimization for %s: %s", file_path, output_path)
+                    return output_path
             
-            # Run in executor
-            result_path = await asyncio.get_event_loop().run_in_executor(
-                None, process_image
+            # Process image in a worker process; Pillow work is CPU-bound
+            result_path = await loop.run_in_executor(
+                _get_image_pool(),
+                _process_image,
+                file_path,
+                output_path,
+                quality,
+                max_width,
+                max_height,
+                convert_to_webp
             )
             
-            logger.info(f"Optimized image saved to: {result_path}")
+            if cache_path:
+                await loop.run_in_executor(None, _copy_file, result_path, cache_path)
+                await loop.run_in_executor(
+                    None, _prune_cache, self.cache_dir, self.cache_max_bytes
+                )
+            
+            logger.info("Optimized image saved to: %s", result_path)
             return result_path
             
         except Exception as e:
-            logger.error(f"Error optimizing image {file_path}: {e}")
+            logger.error("Error optimizing image %s: %s", file_path, e)
             raise
     
+    async def optimize_image_bytes(
+        self,
+        file_path: str,
+        quality: int = DEFAULT_QUALITY,
+        max_width: int = DEFAULT_MAX_WIDTH,
+        max_height: int = DEFAULT_MAX_HEIGHT,
+        convert_to_webp: bool = False
+    ) -> bytes:
+        """
+        Optimize an image file into memory without writing an output file.
+        
+        Args:
+            file_path: Path to the input image
+            quality: Compression quality (1-100)
+            max_width: Maximum width for resizing
+            max_height: Maximum height for resizing
+            convert_to_webp: Whether to convert to WebP format
+            
+        Returns:
+            bytes: Optimized image (the input's own bytes when it is
+            already small enough and carries no metadata)
+        """
+        try:
+            loop = asyncio.get_running_loop()
+            
+            if not convert_to_webp and self._can_skip_optimization(file_path, max_width, max_height):
+                logger.info("Skipping optimization for already small image: %s", file_path)
+                return await loop.run_in_executor(None, Path(file_path).read_bytes)
+            
+            # Kept apart from optimize_image's entries: only this path may
+            # keep the original over a re-encode
+            cache_path = None
+            if self.cache_dir:
+                digest = await loop.run_in_executor(
+                    None, file_digest, file_path, 'bytes', _backend(),
+                    quality, max_width, max_height, convert_to_webp
+                )
+                suffix = '.webp' if convert_to_webp else Path(file_path).suffix
+                cache_path = os.path.join(self.cache_dir, digest + suffix)
+                try:
+                    image_bytes = await loop.run_in_executor(None, _read_cached, cache_path)
+                except FileNotFoundError:
+                    pass
+                else:
+                    logger.info("Reused cached optimization for %s", file_path)
+                    return image_bytes
+            
+            image_bytes = await loop.run_in_executor(
+                _get_image_pool(),
+                _process_image_bytes,
+                file_path,
+                quality,
+                max_width,
+                max_height,
+                convert_to_webp
+            )
+            
+            if cache_path:
+                await loop.run_in_executor(None, _write_file, cache_path, image_bytes)
+                await loop.run_in_executor(
+                    None, _prune_cache, self.cache_dir, self.cache_max_bytes
+                )
+            
+            logger.info("Optimized %s in memory: %d bytes", file_path, len(image_bytes))
+            return image_bytes
+            
+        except Exception as e:
+            logger.error("Error optimizing image %s: %s", file_path, e)
+            raise
+    
+    def _can_skip_optimization(self, file_path: str, max_width: int, max_height: int) -> bool:
+        """
+        Check whether an image can be used as-is without re-encoding.
+        
+        Only the file header is read; pixel data is never decoded.
+        
+        Args:
+            file_path: Path to the input image
+            max_width: Maximum width
+            max_height: Maximum height
+            
+        Returns:
+            bool: True if the image is small, within bounds, upright and
+            free of metadata such as EXIF GPS tags
+        """
+        try:
+            if os.stat(file_path).st_size >= self.SKIP_THRESHOLD:
+                return False
+        except OSError:
+            return False
+        return _fits_as_is(file_path, max_width, max_height, require_plain=True)
+    
     def _resize_image(self, img: Image.Image, max_width: int, max_height: int) -> Image.Image:
         """
         Resize image while maintaining aspect ratio.
@@ -156,15 +821,7 @@ class ImageProcessor:
         Returns:
             PIL Image object (resized if necessary)
         """
-        if img.width <= max_width and img.height <= max_height:
-            return img
-        
-        # Calculate new dimensions maintaining aspect ratio
-        ratio = min(max_width / img.width, max_height / img.height)
-        new_width = int(img.width * ratio)
-        new_height = int(img.height * ratio)
-        
-        return img.resize((new_width, new_height), Image.Resampling.LANCZOS)
+        return _resize_image(img, max_width, max_height)
     
     def normalize_filename(self, filename: str) -> str:
         """
@@ -176,13 +833,8 @@ class ImageProcessor:
         Returns:
             str: URL-safe filename
         """
-        # Remove or replace unsafe characters
-        safe_chars = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789-_."
-        safe_filename = "".join(c if c in safe_chars else "_" for c in filename)
-        
-        # Remove multiple consecutive underscores
-        while "__" in safe_filename:
-            safe_filename = safe_filename.replace("__", "_")
+        # Replace unsafe characters and collapse runs of underscores
+        safe_filename = _UNDERSCORE_RE.sub('_', filename.translate(_FILENAME_TABLE))
         
         # Ensure it doesn't start or end with underscore
         safe_filename = safe_filename.strip("_")
@@ -200,7 +852,7 @@ class ImageProcessor:
         max_width: int = DEFAULT_MAX_WIDTH,
         max_height: int = DEFAULT_MAX_HEIGHT,
         convert_to_webp: bool = False,
-        max_concurrent: int = 3
+        max_concurrent: Optional[int] = None
     ) -> list[Dict[str, Any]]:
         """
         Optimize multiple images concurrently.
@@ -211,49 +863,47 @@ class ImageProcessor:
             max_width: Maximum width
             max_height: Maximum height
             convert_to_webp: Whether to convert to WebP
-            max_concurrent: Maximum concurrent operations
+            max_concurrent: Maximum concurrent operations (defaults to CPU count)
             
         Returns:
             List of optimization results
         """
-        semaphore = asyncio.Semaphore(max_concurrent)
-        
         async def optimize_single(file_path: str) -> Dict[str, Any]:
-            async with semaphore:
-                try:
-                    if not self.is_supported_format(file_path):
-                        return {
-                            'success': False,
-                            'file_path': file_path,
-                            'error': f'Unsupported format: {Path(file_path).suffix}'
-                        }
-                    
-                    output_path = await self.optimize_image(
-                        file_path,
-                        quality=quality,
-                        max_width=max_width,
-                        max_height=max_height,
-                        convert_to_webp=convert_to_webp
-                    )
-                    
-                    return {
-                        'success': True,
-                        'file_path': file_path,
-                        'output_path': output_path,
-                        'original_size': os.path.getsize(file_path),
-                        'optimized_size': os.path.getsize(output_path)
-                    }
-                    
-                except Exception as e:
+            try:
+                if not self.is_supported_format(file_path):
                     return {
                         'success': False,
                         'file_path': file_path,
-                        'error': str(e)
+                        'error': f'Unsupported format: {Path(file_path).suffix}'
                     }
+                
+                output_path = await self.optimize_image(
+                    file_path,
+                    quality=quality,
+                    max_width=max_width,
+                    max_height=max_height,
+                    convert_to_webp=convert_to_webp
+                )
+                
+                return {
+                    'success': True,
+                    'file_path': file_path,
+                    'output_path': output_path,
+                    'original_size': os.path.getsize(file_path),
+                    'optimized_size': os.path.getsize(output_path)
+                }
+            
+            except Exception as e:
+                return {
+                    'success': False,
+                    'file_path': file_path,
+                    'error': str(e)
+                }
         
-        # Execute optimizations concurrently
-        tasks = [optimize_single(file_path) for file_path in file_paths]
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+        # Execute optimizations with a bounded pool of workers
+        results = await bounded_map(
+            optimize_single, file_paths, max_concurrent or os.cpu_count() or 1
+        )
         
         # Handle exceptions
         processed_results = []
@@ -279,11 +929,16 @@ class ImageProcessor:
         Returns:
             dict: Statistics about the optimization process
         """
-        successful = [r for r in results if r.get('success', False)]
-        failed = [r for r in results if not r.get('success', False)]
-        
-        total_original_size = sum(r.get('original_size', 0) for r in successful)
-        total_optimized_size = sum(r.get('optimized_size', 0) for r in successful)
+        # Single pass over the results
+        successful = failed = 0
+        total_original_size = total_optimized_size = 0
+        for r in results:
+            if r.get('success', False):
+                successful += 1
+                total_original_size += r.get('original_size', 0)
+                total_optimized_size += r.get('optimized_size', 0)
+            else:
+                failed += 1
         
         compression_ratio = 0
         if total_original_size > 0:
@@ -291,8 +946,8 @@ class ImageProcessor:
         
         return {
             'total_files': len(results),
-            'successful': len(successful),
-            'failed': len(failed),
+            'successful': successful,
+            'failed': failed,
             'total_original_size': total_original_size,
             'total_optimized_size': total_optimized_size,
             'compression_ratio': round(compression_ratio, 2),
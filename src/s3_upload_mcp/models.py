@@ -4,33 +4,24 @@ Pydantic Models for S3 Upload MCP Server
 Defines data models for type safety and validation.
 """
 
-from typing import Optional, List, Dict, Any
-from pydantic import BaseModel, Field, field_validator
+from typing import Annotated, Optional, List, Dict, Any
+from pydantic import BaseModel, ConfigDict, Field, StringConstraints
 from datetime import datetime
 
+# Stripped, non-empty string; validated in pydantic-core without a Python callback
+NonEmptyStr = Annotated[str, StringConstraints(strip_whitespace=True, min_length=1)]
+
 
 class UploadRequest(BaseModel):
     """Request model for single image upload."""
-    file_path: str = Field(..., description="Path to the image file to upload")
-    bucket_name: str = Field(..., description="S3 bucket name")
+    model_config = ConfigDict(frozen=True)
+    
+    file_path: NonEmptyStr = Field(..., description="Path to the image file to upload")
+    bucket_name: NonEmptyStr = Field(..., description="S3 bucket name")
     key: Optional[str] = Field(None, description="S3 object key (auto-generated if not provided)")
     optimize: bool = Field(True, description="Enable image optimization")
     quality: int = Field(80, ge=1, le=100, description="Compression quality (1-100)")
     folder_prefix: Optional[str] = Field(None, description="S3 folder prefix")
-    
-    @field_validator('file_path')
-    @classmethod
-    def validate_file_path(cls, v):
-        if not v or not v.strip():
-            raise ValueError("File path cannot be empty")
-        return v.strip()
-    
-    @field_validator('bucket_name')
-    @classmethod
-    def validate_bucket_name(cls, v):
-        if not v or not v.strip():
-            raise ValueError("Bucket name cannot be empty")
-        return v.strip()
 
 
 class UploadResponse(BaseModel):
@@ -48,29 +39,15 @@ class UploadResponse(BaseModel):
 
 class BatchUploadRequest(BaseModel):
     """Request model for batch image upload."""
-    file_paths: List[str] = Field(..., min_length=1, description="List of image file paths to upload")
-    bucket_name: str = Field(..., description="S3 bucket name")
+    model_config = ConfigDict(frozen=True)
+    
+    file_paths: List[NonEmptyStr] = Field(..., min_length=1, description="List of image file paths to upload")
+    bucket_name: NonEmptyStr = Field(..., description="S3 bucket name")
     folder_prefix: Optional[str] = Field(None, description="S3 folder prefix")
     optimize: bool = Field(True, description="Enable image optimization")
     quality: int = Field(80, ge=1, le=100, description="Compression quality (1-100)")
     max_concurrent: int = Field(5, ge=1, le=10, description="Maximum concurrent uploads")
-    
-    @field_validator('file_paths')
-    @classmethod
-    def validate_file_paths(cls, v):
-        if not v:
-            raise ValueError("File paths list cannot be empty")
-        for path in v:
-            if not path or not path.strip():
-                raise ValueError("File path cannot be empty")
-        return [path.strip() for path in v]
-    
-    @field_validator('bucket_name')
-    @classmethod
-    def validate_bucket_name(cls, v):
-        if not v or not v.strip():
-            raise ValueError("Bucket name cannot be empty")
-        return v.strip()
+    max_concurrent_optimizations: Optional[int] = Field(None, ge=1, description="Maximum concurrent image optimizations (defaults to CPU count)")
 
 
 class BatchUploadResponse(BaseModel):
@@ -4,19 +4,128 @@ AWS S3 Client for MCP Server
 Handles S3 operations including file uploads, URL generation, and bucket management.
 """
 
+import io
 import os
+import re
+import time
 import asyncio
+import itertools
 import logging
-from typing import Optional, Dict, Any, List
+from collections import Counter
+from typing import Optional, Dict, Any, List, AsyncIterable, BinaryIO, Iterable, NamedTuple, Tuple, Union
 from datetime import datetime, timezone
 from pathlib import Path
+from types import MappingProxyType
 
 import boto3
+from botocore.compat import HAS_CRT
+from botocore.config import Config
 from botocore.exceptions import ClientError, NoCredentialsError
-from boto3.s3.transfer import TransferConfig
+from boto3.s3.transfer import TransferConfig, create_transfer_manager
+from s3transfer.subscribers import BaseSubscriber
+
+from .utils import bounded_map, bytes_digest, file_digest, file_suffix
 
 logger = logging.getLogger(__name__)
 
+# Shared client config: a connection pool large enough for the transfer
+# manager's threads, TCP keepalive and adaptive retries
+_BOTO_CONFIG = Config(
+    max_pool_connections=64,
+    tcp_keepalive=True,
+    retries={'max_attempts': 3, 'mode': 'adaptive'}
+)
+
+# Characters dropped from key names; \w matches exactly str.isalnum() or "_"
+_UNSAFE_KEY_CHARS_RE = re.compile(r'[^\w-]+')
+
+# Per-process sequence appended to generated keys so files named in the
+# same second never collide
+_KEY_COUNTER = itertools.count()
+
+# Uploads remembered for server-side copies of repeated content
+_MAX_TRACKED_UPLOADS = 4096
+
+# Seconds a bucket listing is reused; bucket membership rarely changes
+_BUCKET_CACHE_TTL = 30.0
+
+# CopyObject only supports sources up to 5GB
+_MAX_COPY_SIZE = 5 * 1024 * 1024 * 1024
+
+# MIME types by lowercase file extension
+_CONTENT_TYPES = MappingProxyType({
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png',
+    '.gif': 'image/gif',
+    '.webp': 'image/webp',
+    '.svg': 'image/svg+xml',
+    '.bmp': 'image/bmp',
+    '.tiff': 'image/tiff',
+    '.ico': 'image/x-icon'
+})
+
+
+class _UploadRecord(NamedTuple):
+    """What this client last uploaded under one key."""
+    size: int
+    # None until an upload of the same size needs it; file_path and
+    # mtime_ns then identify the unchanged source to hash
+    digest: Optional[str]
+    file_path: Optional[str] = None
+    mtime_ns: Optional[int] = None
+    # ETag S3 returned for the upload or copy; copies from the key are
+    # conditional on it, so they fail if anyone else overwrote the key
+    etag: Optional[str] = None
+
+
+def _digests_if_unchanged(records: List[_UploadRecord]) -> List[Optional[str]]:
+    """
+    Hash the source files of earlier uploads that have not changed since.
+    
+    Args:
+        records: Upload records with a file_path and mtime_ns
+    
+    Returns:
+        list: Digest per record, or None if its file changed or is gone
+    """
+    digests = []
+    for record in records:
+        try:
+            stat = os.stat(record.file_path)
+            unchanged = stat.st_size == record.size and stat.st_mtime_ns == record.mtime_ns
+            digests.append(file_digest(record.file_path) if unchanged else None)
+        except OSError:
+            digests.append(None)
+    return digests
+
+
+def _remember_request_key(params: Dict[str, Any], context: Dict[str, Any], **kwargs) -> None:
+    """Keep an upload call's key in its request context (see S3Client._record_etag)."""
+    context['s3_upload_key'] = params.get('Key')
+
+
+class _AsyncDoneSubscriber(BaseSubscriber):
+    """Resolves an asyncio future when an s3transfer transfer finishes."""
+    
+    def __init__(self, loop: asyncio.AbstractEventLoop, waiter: asyncio.Future):
+        self._loop = loop
+        self._waiter = waiter
+    
+    def on_done(self, future, **kwargs):
+        # Called on a transfer thread; hand the result back to the event loop
+        self._loop.call_soon_threadsafe(_set_transfer_result, self._waiter, future)
+
+
+def _set_transfer_result(waiter: asyncio.Future, future) -> None:
+    """Copy a finished transfer future's outcome onto an asyncio future."""
+    if waiter.done():
+        return
+    try:
+        waiter.set_result(future.result())
+    except Exception as e:
+        waiter.set_exception(e)
+
 
 class S3Client:
     """AWS S3 client wrapper for MCP server operations."""
@@ -32,22 +141,68 @@ class S3Client:
         self.region = region
         self.bucket_name = bucket_name
         
-        # Initialize boto3 client
+        # Initialize boto3 client (boto3.client reuses boto3's default session)
         try:
             self.s3_client = boto3.client(
                 's3',
                 region_name=region,
                 aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-                aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY')
+                aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
+                config=_BOTO_CONFIG
+            )
+            # One transfer manager shared by every upload. Without the [crt]
+            # extra, boto3's classic manager applies all of these settings,
+            # uploading parts on max_concurrency threads. With it, the AWS
+            # CRT uploads parts in native code and sizes its connection pool
+            # from its own target throughput: it honors the part size and
+            # threshold, but max_concurrency only caps its connections with
+            # s3transfer>=0.16 and awscrt>=0.29 and is ignored otherwise.
+            self._transfer_config = TransferConfig(
+                multipart_threshold=16 * 1024 * 1024,  # 16MB
+                multipart_chunksize=8 * 1024 * 1024,  # 8MB
+                max_concurrency=max(8, (os.cpu_count() or 1) * 2),
+                preferred_transfer_client='crt' if HAS_CRT else 'auto'
             )
-            logger.info(f"S3 client initialized for region: {region}, bucket: {bucket_name}")
+            self._transfer = create_transfer_manager(self.s3_client, self._transfer_config)
+            # Key -> what this client last uploaded there, oldest first
+            self._uploads: Dict[str, _UploadRecord] = {}
+            # Content digest -> a key currently holding that content
+            self._uploaded_digests: Dict[str, str] = {}
+            # Sizes of the tracked uploads; content is only hashed when
+            # an earlier upload had the same size
+            self._upload_sizes: Counter = Counter()
+            # Key -> ETag of its last completed upload; the transfer manager
+            # drops S3's responses, so they are read from botocore events.
+            # The CRT bypasses botocore, so its uploads are never copied from.
+            self._etags: Dict[str, str] = {}
+            events = self.s3_client.meta.events
+            for operation in ('PutObject', 'CompleteMultipartUpload'):
+                events.register(f'before-parameter-build.s3.{operation}', _remember_request_key)
+                events.register(f'after-call.s3.{operation}', self._record_etag)
+            # (expires_at, bucket names) from the last successful listing
+            self._bucket_cache: Optional[Tuple[float, List[str]]] = None
+            self._bucket_lock = asyncio.Lock()
+            logger.info("S3 client initialized for region: %s, bucket: %s", region, bucket_name)
         except NoCredentialsError:
             logger.error("AWS credentials not found. Please set AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY")
             raise
         except Exception as e:
-            logger.error(f"Failed to initialize S3 client: {e}")
+            logger.error("Failed to initialize S3 client: %s", e)
             raise
     
+    async def __aenter__(self) -> "S3Client":
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.close()
+    
+    async def close(self) -> None:
+        """Wait for in-flight transfers, then release the connection pool."""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._transfer.shutdown)
+        self.s3_client.close()
+        logger.info("S3 client closed")
+    
     async def test_connection(self) -> bool:
         """
         Test S3 connection and bucket access.
@@ -58,19 +213,19 @@ class S3Client:
         try:
             # Test bucket access
             self.s3_client.head_bucket(Bucket=self.bucket_name)
-            logger.info(f"Successfully connected to S3 bucket: {self.bucket_name}")
+            logger.info("Successfully connected to S3 bucket: %s", self.bucket_name)
             return True
         except ClientError as e:
             error_code = e.response['Error']['Code']
             if error_code == '404':
-                logger.error(f"S3 bucket '{self.bucket_name}' not found")
+                logger.error("S3 bucket '%s' not found", self.bucket_name)
             elif error_code == '403':
-                logger.error(f"Access denied to S3 bucket '{self.bucket_name}'")
+                logger.error("Access denied to S3 bucket '%s'", self.bucket_name)
             else:
-                logger.error(f"S3 connection error: {e}")
+                logger.error("S3 connection error: %s", e)
             return False
         except Exception as e:
-            logger.error(f"Unexpected error testing S3 connection: {e}")
+            logger.error("Unexpected error testing S3 connection: %s", e)
             return False
     
     async def upload_file(
@@ -93,121 +248,312 @@ class S3Client:
             dict: Upload result with URL and metadata
         """
         try:
-            # Prepare metadata
-            upload_metadata = {
-                'uploaded_at': datetime.now(timezone.utc).isoformat(),
-                'original_filename': Path(file_path).name,
-                'source': 's3-upload-mcp-server'
-            }
-            if metadata:
-                upload_metadata.update(metadata)
+            stat = os.stat(file_path)
+            file_size = stat.st_size
             
-            # Determine content type
-            if not content_type:
-                content_type = self._get_content_type(file_path)
+            # Hashing is a second read of the file, so it is only done when
+            # content of the same size was uploaded before and a server-side
+            # copy could replace the upload
+            if self._upload_sizes[file_size]:
+                await self._hash_pending(file_size)
+                digest = await asyncio.get_running_loop().run_in_executor(None, file_digest, file_path)
+                record = _UploadRecord(file_size, digest)
+            else:
+                record = _UploadRecord(file_size, None, file_path, stat.st_mtime_ns)
             
-            # Configure transfer for large files
-            file_size = os.path.getsize(file_path)
-            transfer_config = TransferConfig(
-                multipart_threshold=5 * 1024 * 1024,  # 5MB
-                max_concurrency=10,
-                use_threads=True
+            result = await self._upload(
+                file_path, file_path, key, record, metadata, content_type
             )
             
-            # Upload file
-            extra_args = {
-                'Metadata': upload_metadata,
-                'ContentType': content_type,
-                'ACL': 'public-read'  # Make file publicly accessible
-            }
+            logger.info("Successfully uploaded %s to S3: %s", file_path, result['url'])
+            return result
             
-            await asyncio.get_event_loop().run_in_executor(
-                None,
-                lambda: self.s3_client.upload_file(
-                    file_path,
-                    self.bucket_name,
-                    key,
-                    ExtraArgs=extra_args,
-                    Config=transfer_config
-                )
+        except Exception as e:
+            return self._upload_error(e, key)
+    
+    async def upload_bytes(
+        self,
+        data: bytes,
+        key: str,
+        file_path: str,
+        metadata: Optional[Dict[str, str]] = None,
+        content_type: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Upload in-memory content to S3 without staging it on disk.
+        
+        Args:
+            data: Content to upload
+            key: S3 object key
+            file_path: Local file the content was produced from (used for
+                the original_filename metadata and content type detection)
+            metadata: Optional metadata to attach
+            content_type: MIME content type
+            
+        Returns:
+            dict: Upload result with URL and metadata
+        """
+        try:
+            # Hashing memory costs no extra read, so content is always hashed
+            if self._upload_sizes[len(data)]:
+                await self._hash_pending(len(data))
+            digest = await asyncio.get_running_loop().run_in_executor(None, bytes_digest, data)
+            # The encoder has already finished by the time we get here, so it
+            # never stalls on the network; the transfer manager drains this
+            # buffer part by part at its own pace, bounded by its part queue
+            result = await self._upload(
+                io.BytesIO(data), file_path, key, _UploadRecord(len(data), digest),
+                metadata, content_type
             )
             
-            # Generate public URL
-            url = f"https://{self.bucket_name}.s3.{self.region}.amazonaws.com/{key}"
+            logger.info("Successfully uploaded %d bytes from %s to S3: %s", len(data), file_path, result['url'])
+            return result
             
-            result = {
-                'success': True,
-                'url': url,
-                'key': key,
-                'bucket': self.bucket_name,
-                'size': file_size,
-                'content_type': content_type,
-                'metadata': upload_metadata
-            }
+        except Exception as e:
+            return self._upload_error(e, key)
+    
+    async def _upload(
+        self,
+        source: Union[str, BinaryIO],
+        file_path: str,
+        key: str,
+        record: _UploadRecord,
+        metadata: Optional[Dict[str, str]],
+        content_type: Optional[str]
+    ) -> Dict[str, Any]:
+        """
+        Send a file or file object through the shared transfer manager.
+        
+        Args:
+            source: Local file path or readable binary file object
+            file_path: Local file path the content belongs to
+            key: S3 object key
+            record: Size and (if computed) digest of the content; a known
+                digest lets repeated content be copied server-side
+            metadata: Optional metadata to attach
+            content_type: MIME content type
             
-            logger.info(f"Successfully uploaded {file_path} to S3: {url}")
-            return result
+        Returns:
+            dict: Upload result with URL and metadata
+        """
+        # Prepare metadata
+        upload_metadata = {
+            'uploaded_at': datetime.now(timezone.utc).isoformat(),
+            'original_filename': Path(file_path).name,
+            'source': 's3-upload-mcp-server'
+        }
+        if metadata:
+            upload_metadata.update(metadata)
+        
+        # Determine content type
+        if not content_type:
+            content_type = self._get_content_type(file_path)
+        
+        # Upload file
+        extra_args = {
+            'Metadata': upload_metadata,
+            'ContentType': content_type,
+            'ACL': 'public-read',  # Make file publicly accessible
+            # Checksum is computed while streaming each part and verified
+            # by S3, so integrity checking needs no extra pass over the file
+            'ChecksumAlgorithm': 'CRC32'
+        }
+        
+        # Content already uploaded under another key is copied
+        # server-side instead of being sent again
+        source_key = record.digest and self._uploaded_digests.get(record.digest)
+        source_etag = source_key and self._uploads[source_key].etag
+        # Whatever the key held before is being replaced
+        self._forget_key(key)
+        self._etags.pop(key, None)
+        etag = None
+        if source_etag and record.size < _MAX_COPY_SIZE:
+            etag = await self._copy_object(source_key, source_etag, key, extra_args)
+        
+        if not etag:
+            # Await completion on the event loop rather than parking an
+            # executor thread on future.result()
+            loop = asyncio.get_running_loop()
+            waiter = loop.create_future()
+            self._transfer.upload(
+                source,
+                self.bucket_name,
+                key,
+                extra_args=extra_args,
+                subscribers=[_AsyncDoneSubscriber(loop, waiter)]
+            )
+            await waiter
+            etag = self._etags.pop(key, None)
+        
+        self._remember_upload(key, record._replace(etag=etag))
+        
+        # Generate public URL
+        url = f"https://{self.bucket_name}.s3.{self.region}.amazonaws.com/{key}"
+        
+        return {
+            'success': True,
+            'url': url,
+            'key': key,
+            'bucket': self.bucket_name,
+            'size': record.size,
+            'content_type': content_type,
+            'metadata': upload_metadata
+        }
+    
+    def _upload_error(self, error: Exception, key: str) -> Dict[str, Any]:
+        """
+        Log an upload failure and build its result.
+        
+        Args:
+            error: Exception raised by the upload
+            key: S3 object key
+            
+        Returns:
+            dict: Failed upload result
+        """
+        if isinstance(error, ClientError):
+            error_msg = f"S3 upload error: {error.response['Error']['Message']}"
+        else:
+            error_msg = f"Unexpected upload error: {str(error)}"
+        logger.error(error_msg)
+        return {
+            'success': False,
+            'error': error_msg,
+            'key': key
+        }
+    
+    async def _copy_object(
+        self,
+        source_key: str,
+        source_etag: str,
+        key: str,
+        extra_args: Dict[str, Any]
+    ) -> Optional[str]:
+        """
+        Copy an object already in the bucket to a new key.
+        
+        Args:
+            source_key: Existing S3 object key
+            source_etag: ETag the source must still have; the copy fails
+                with PreconditionFailed if the key was overwritten since
+            key: Destination S3 object key
+            extra_args: Upload arguments (metadata, content type, ACL)
             
+        Returns:
+            str: ETag of the copy, or None if the caller should upload instead
+        """
+        try:
+            response = await asyncio.get_event_loop().run_in_executor(
+                None,
+                lambda: self.s3_client.copy_object(
+                    Bucket=self.bucket_name,
+                    Key=key,
+                    CopySource={'Bucket': self.bucket_name, 'Key': source_key},
+                    CopySourceIfMatch=source_etag,
+                    MetadataDirective='REPLACE',
+                    Metadata=extra_args['Metadata'],
+                    ContentType=extra_args['ContentType'],
+                    ACL=extra_args['ACL']
+                )
+            )
+            logger.info("Copied existing object %s to %s", source_key, key)
+            return response['CopyObjectResult']['ETag']
         except ClientError as e:
-            error_msg = f"S3 upload error: {e.response['Error']['Message']}"
-            logger.error(error_msg)
-            return {
-                'success': False,
-                'error': error_msg,
-                'key': key
-            }
-        except Exception as e:
-            error_msg = f"Unexpected upload error: {str(e)}"
-            logger.error(error_msg)
-            return {
-                'success': False,
-                'error': error_msg,
-                'key': key
-            }
+            # Source may have been deleted or overwritten; fall back to a
+            # regular upload
+            logger.warning("Server-side copy from %s failed, uploading: %s", source_key, e)
+            self._forget_key(source_key)
+            return None
+    
+    def _record_etag(self, parsed: Dict[str, Any], context: Dict[str, Any], **kwargs) -> None:
+        """Keep the ETag of a completed upload call (runs on transfer threads)."""
+        key = context.get('s3_upload_key')
+        etag = parsed.get('ETag')
+        if key and etag:
+            self._etags[key] = etag
+    
+    async def _hash_pending(self, size: int) -> None:
+        """Hash earlier unhashed uploads of the given size so they can be copied."""
+        pending = [
+            (key, record) for key, record in self._uploads.items()
+            if record.size == size and record.digest is None
+        ]
+        if not pending:
+            return
+        
+        digests = await asyncio.get_running_loop().run_in_executor(
+            None, _digests_if_unchanged, [record for _, record in pending]
+        )
+        for (key, record), digest in zip(pending, digests):
+            # Skip keys overwritten while hashing
+            if digest and self._uploads.get(key) is record:
+                self._uploads[key] = record._replace(digest=digest, file_path=None, mtime_ns=None)
+                self._uploaded_digests.setdefault(digest, key)
+    
+    def _remember_upload(self, key: str, record: _UploadRecord) -> None:
+        """Track what was uploaded to a key, evicting the oldest beyond the limit."""
+        self._forget_key(key)
+        self._uploads[key] = record
+        self._upload_sizes[record.size] += 1
+        if record.digest:
+            self._uploaded_digests[record.digest] = key
+        if len(self._uploads) > _MAX_TRACKED_UPLOADS:
+            self._forget_key(next(iter(self._uploads)))
+    
+    def _forget_key(self, key: str) -> None:
+        """Stop treating a key as holding its last uploaded content."""
+        record = self._uploads.pop(key, None)
+        if record is None:
+            return
+        
+        self._upload_sizes[record.size] -= 1
+        if not self._upload_sizes[record.size]:
+            del self._upload_sizes[record.size]
+        
+        if record.digest and self._uploaded_digests.get(record.digest) == key:
+            # Point the digest at another key with the same content, if any
+            other_key = next(
+                (k for k, r in self._uploads.items() if r.digest == record.digest), None
+            )
+            if other_key:
+                self._uploaded_digests[record.digest] = other_key
+            else:
+                del self._uploaded_digests[record.digest]
     
     async def upload_multiple(
         self,
-        files: List[Dict[str, Any]],
+        files: Union[Iterable[Dict[str, Any]], AsyncIterable[Dict[str, Any]]],
         max_concurrent: int = 5
     ) -> List[Dict[str, Any]]:
         """
         Upload multiple files concurrently.
         
         Args:
-            files: List of file dictionaries with 'file_path' and 'key'
+            files: File dictionaries with 'file_path' and 'key' (optionally
+                'metadata' and 'content_type'); may be a lazy or async
+                iterable, which is consumed as uploads free up
             max_concurrent: Maximum concurrent uploads
             
         Returns:
-            List of upload results
+            List of upload results, in input order
         """
-        semaphore = asyncio.Semaphore(max_concurrent)
-        
         async def upload_single(file_info: Dict[str, Any]) -> Dict[str, Any]:
-            async with semaphore:
+            try:
                 return await self.upload_file(
                     file_info['file_path'],
                     file_info['key'],
                     file_info.get('metadata'),
                     file_info.get('content_type')
                 )
-        
-        # Execute uploads concurrently
-        tasks = [upload_single(file_info) for file_info in files]
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-        
-        # Handle exceptions
-        processed_results = []
-        for i, result in enumerate(results):
-            if isinstance(result, Exception):
-                processed_results.append({
+            except Exception as e:
+                return {
                     'success': False,
-                    'error': str(result),
-                    'key': files[i].get('key', 'unknown')
-                })
-            else:
-                processed_results.append(result)
+                    'error': str(e),
+                    'key': file_info.get('key', 'unknown')
+                }
         
-        return processed_results
+        # Execute uploads with a bounded pool of workers
+        return await bounded_map(upload_single, files, max_concurrent)
     
     async def list_buckets(self) -> List[str]:
         """
@@ -217,18 +563,25 @@ class S3Client:
             List of bucket names
         """
         try:
-            response = await asyncio.get_event_loop().run_in_executor(
-                None,
-                self.s3_client.list_buckets
-            )
-            buckets = [bucket['Name'] for bucket in response['Buckets']]
-            logger.info(f"Found {len(buckets)} accessible buckets")
-            return buckets
+            # Concurrent callers wait for one ListBuckets call instead of
+            # each issuing their own
+            async with self._bucket_lock:
+                if self._bucket_cache and time.monotonic() < self._bucket_cache[0]:
+                    return list(self._bucket_cache[1])
+                
+                response = await asyncio.get_event_loop().run_in_executor(
+                    None,
+                    self.s3_client.list_buckets
+                )
+                buckets = [bucket['Name'] for bucket in response['Buckets']]
+                self._bucket_cache = (time.monotonic() + _BUCKET_CACHE_TTL, buckets)
+            logger.info("Found %d accessible buckets", len(buckets))
+            return list(buckets)
         except ClientError as e:
-            logger.error(f"Error listing buckets: {e}")
+            logger.error("Error listing buckets: %s", e)
             return []
         except Exception as e:
-            logger.error(f"Unexpected error listing buckets: {e}")
+            logger.error("Unexpected error listing buckets: %s", e)
             return []
     
     def _get_content_type(self, file_path: str) -> str:
@@ -241,19 +594,7 @@ class S3Client:
         Returns:
             MIME content type
         """
-        extension = Path(file_path).suffix.lower()
-        content_types = {
-            '.jpg': 'image/jpeg',
-            '.jpeg': 'image/jpeg',
-            '.png': 'image/png',
-            '.gif': 'image/gif',
-            '.webp': 'image/webp',
-            '.svg': 'image/svg+xml',
-            '.bmp': 'image/bmp',
-            '.tiff': 'image/tiff',
-            '.ico': 'image/x-icon'
-        }
-        return content_types.get(extension, 'application/octet-stream')
+        return _CONTENT_TYPES.get(file_suffix(file_path), 'application/octet-stream')
     
     def generate_key(self, file_path: str, folder_prefix: Optional[str] = None) -> str:
         """
@@ -266,14 +607,27 @@ class S3Client:
         Returns:
             S3 object key
         """
-        filename = Path(file_path).name
-        timestamp = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
-        name, ext = os.path.splitext(filename)
+        return self.generate_keys([file_path], folder_prefix)[0]
+    
+    def generate_keys(self, file_paths: List[str], folder_prefix: Optional[str] = None) -> List[str]:
+        """
+        Generate S3 keys for many file paths in one pass.
+        
+        The timestamp and prefix are computed once for the whole batch.
         
-        # Create URL-safe filename
-        safe_name = "".join(c for c in name if c.isalnum() or c in ('-', '_')).rstrip()
-        safe_filename = f"{safe_name}_{timestamp}{ext}"
+        Args:
+            file_paths: Local file paths
+            folder_prefix: Optional folder prefix
+            
+        Returns:
+            S3 object keys, in the same order as file_paths
+        """
+        timestamp = time.strftime("%Y%m%d_%H%M%S", time.gmtime())
+        prefix = f"{folder_prefix.rstrip('/')}/" if folder_prefix else ""
+        sub = _UNSAFE_KEY_CHARS_RE.sub
         
-        if folder_prefix:
-            return f"{folder_prefix.rstrip('/')}/{safe_filename}"
-        return safe_filename
+        # Create URL-safe filenames
+        return [
+            f"{prefix}{sub('', name)}_{timestamp}_{next(_KEY_COUNTER)}{ext}"
+            for name, ext in map(os.path.splitext, map(os.path.basename, file_paths))
+        ]
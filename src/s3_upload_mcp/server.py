@@ -7,11 +7,15 @@ specifically designed for Figma → MCP → HTML workflows.
 
 import os
 import logging
-from typing import Optional
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
 from fastmcp import FastMCP
 from dotenv import load_dotenv
 
-from .tools import upload_image_to_s3, batch_upload_images, list_s3_buckets, get_server_info, set_global_instances
+from .tools import (
+    upload_image_to_s3, batch_upload_images, list_s3_buckets, get_server_info,
+    ToolContext, TOOL_CONTEXT_KEY
+)
 from .s3_client import S3Client
 from .image_processor import ImageProcessor
 
@@ -25,17 +29,32 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Initialize FastMCP server
-mcp = FastMCP("S3 Upload Server")
+# Services shared by the tools (created by initialize_services)
+tool_context: Optional[ToolContext] = None
+
+
+@asynccontextmanager
+async def lifespan(server: FastMCP) -> AsyncIterator[Dict[str, Any]]:
+    """Publish the shared services to tools and close them on shutdown."""
+    global tool_context
+    if tool_context is None:
+        initialize_services()
+    try:
+        async with tool_context.s3, tool_context.images:
+            yield {TOOL_CONTEXT_KEY: tool_context}
+    finally:
+        # Closed services cannot be reused, even if the server failed; a
+        # restart initializes new ones
+        tool_context = None
 
-# Global instances
-s3_client: Optional[S3Client] = None
-image_processor: Optional[ImageProcessor] = None
+
+# Initialize FastMCP server
+mcp = FastMCP("S3 Upload Server", lifespan=lifespan)
 
 
 def initialize_services() -> None:
     """Initialize S3 client and image processor with environment variables."""
-    global s3_client, image_processor
+    global tool_context
     
     # Get AWS configuration from environment
     aws_region = os.getenv("AWS_REGION", "ap-northeast-2")
@@ -48,8 +67,7 @@ def initialize_services() -> None:
     s3_client = S3Client(region=aws_region, bucket_name=bucket_name)
     image_processor = ImageProcessor()
     
-    # Set global instances for tools
-    set_global_instances(s3_client, image_processor)
+    tool_context = ToolContext(s3=s3_client, images=image_processor)
     
     logger.info(f"S3 Upload Server initialized with region: {aws_region}, bucket: {bucket_name}")
 
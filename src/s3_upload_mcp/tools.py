@@ -6,9 +6,10 @@ Implements the core MCP tools for image upload and management.
 
 import os
 import time
+import asyncio
 import logging
-from typing import Optional, List
-from pathlib import Path
+from dataclasses import dataclass
+from typing import Any, Dict, FrozenSet, Optional, List, Set, Tuple
 
 from fastmcp import FastMCP, Context
 from .models import (
@@ -17,19 +18,107 @@ from .models import (
 )
 from .s3_client import S3Client
 from .image_processor import ImageProcessor
+from .utils import bounded_map, file_suffix
 
 logger = logging.getLogger(__name__)
 
-# Global instances (will be initialized by server)
-s3_client: Optional[S3Client] = None
-image_processor: Optional[ImageProcessor] = None
+# Lifespan context key under which the server publishes its ToolContext
+TOOL_CONTEXT_KEY = "tools"
 
+# Minimum seconds between batch progress notifications to the client
+PROGRESS_INTERVAL = 0.25
 
-def set_global_instances(client: S3Client, processor: ImageProcessor) -> None:
-    """Set global instances for tools to use."""
-    global s3_client, image_processor
-    s3_client = client
-    image_processor = processor
+
+@dataclass
+class ToolContext:
+    """Services shared by every tool call (created once by the server)."""
+    s3: S3Client
+    images: ImageProcessor
+    # Built on first request; region and bucket never change afterwards
+    server_info: Optional[ServerInfo] = None
+
+
+def get_tool_context(ctx: Context) -> Optional[ToolContext]:
+    """
+    Look up the services the server attached to its lifespan context.
+    
+    Args:
+        ctx: FastMCP Context of the current tool call
+    
+    Returns:
+        ToolContext, or None if the server was not initialized
+    """
+    return ctx.lifespan_context.get(TOOL_CONTEXT_KEY)
+
+
+def _list_directory(directory: str) -> FrozenSet[str]:
+    """
+    List the names of the non-symlink entries in a directory.
+    
+    Symlinks are left out because a listed link may be dangling.
+    
+    Args:
+        directory: Directory path ('' for the current directory)
+    
+    Returns:
+        frozenset: Entry names (empty if the directory cannot be read)
+    """
+    try:
+        with os.scandir(directory or '.') as entries:
+            return frozenset(entry.name for entry in entries if not entry.is_symlink())
+    except OSError:
+        return frozenset()
+
+
+def _existing_paths(file_paths: List[str]) -> List[str]:
+    """
+    Filter paths with os.path.exists.
+    
+    Args:
+        file_paths: Paths to check
+    
+    Returns:
+        list: The paths that exist
+    """
+    return [file_path for file_path in file_paths if os.path.exists(file_path)]
+
+
+async def _find_existing(file_paths: List[str]) -> Set[str]:
+    """
+    Find which paths exist without blocking the event loop.
+    
+    Each parent directory is listed once, in a worker thread, instead of
+    stat-ing every path on the event loop. Names missing from a listing are
+    not assumed absent: case-insensitive or Unicode-normalizing filesystems,
+    symlinks and unreadable directories can all hide them, so those paths
+    are checked with os.path.exists in one more worker thread.
+    
+    Args:
+        file_paths: Paths to check
+    
+    Returns:
+        set: The paths that exist
+    """
+    paths_by_dir: Dict[str, List[str]] = {}
+    for file_path in file_paths:
+        paths_by_dir.setdefault(os.path.dirname(file_path), []).append(file_path)
+    
+    listings = await asyncio.gather(
+        *(asyncio.to_thread(_list_directory, directory) for directory in paths_by_dir)
+    )
+    
+    existing = set()
+    unlisted = []
+    for paths, names in zip(paths_by_dir.values(), listings):
+        for path in paths:
+            if os.path.basename(path) in names:
+                existing.add(path)
+            else:
+                unlisted.append(path)
+    
+    if unlisted:
+        existing.update(await asyncio.to_thread(_existing_paths, unlisted))
+    return existing
 
 
 async def upload_image_to_s3(
@@ -61,11 +150,11 @@ async def upload_image_to_s3(
     try:
         await ctx.info(f"Starting upload of {file_path} to bucket {bucket_name}")
         
-        # Validate inputs
-        if not s3_client:
-            raise ValueError("S3 client not initialized")
-        if not image_processor:
-            raise ValueError("Image processor not initialized")
+        # Resolve services once; locals keep the hot path off globals
+        tool_context = get_tool_context(ctx)
+        if not tool_context:
+            raise ValueError("S3 client and image processor not initialized")
+        s3_client, image_processor = tool_context.s3, tool_context.images
         
         # Check if file exists
         if not os.path.exists(file_path):
@@ -78,45 +167,46 @@ async def upload_image_to_s3(
         if not image_processor.is_supported_format(file_path):
             return UploadResponse(
                 success=False,
-                error=f"Unsupported image format: {Path(file_path).suffix}"
+                error=f"Unsupported image format: {file_suffix(file_path)}"
             )
         
         # Generate S3 key if not provided
         if not key:
             key = s3_client.generate_key(file_path, folder_prefix)
         
-        # Process image if optimization is enabled
-        processed_file_path = file_path
+        # Optimize in memory so the result never touches the disk
+        optimized_data = None
         if optimize:
             await ctx.info(f"Optimizing image with quality {quality}")
             try:
-                processed_file_path = await image_processor.optimize_image(
+                optimized_data = await image_processor.optimize_image_bytes(
                     file_path,
                     quality=quality
                 )
-                await ctx.info(f"Image optimized and saved to: {processed_file_path}")
+                await ctx.info(f"Image optimized in memory: {len(optimized_data)} bytes")
             except Exception as e:
                 await ctx.warning(f"Image optimization failed, using original: {e}")
-                processed_file_path = file_path
         
         # Upload to S3
         await ctx.info(f"Uploading to S3 with key: {key}")
-        upload_result = await s3_client.upload_file(
-            processed_file_path,
-            key,
-            metadata={
-                'original_file': file_path,
-                'optimized': optimize,
-                'quality': str(quality)
-            }
-        )
-        
-        # Clean up temporary optimized file if different from original
-        if processed_file_path != file_path and os.path.exists(processed_file_path):
-            try:
-                os.remove(processed_file_path)
-            except Exception as e:
-                await ctx.warning(f"Failed to clean up temporary file: {e}")
+        metadata = {
+            'original_file': file_path,
+            'optimized': optimize,
+            'quality': str(quality)
+        }
+        if optimized_data is not None:
+            upload_result = await s3_client.upload_bytes(
+                optimized_data,
+                key,
+                file_path,
+                metadata=metadata
+            )
+        else:
+            upload_result = await s3_client.upload_file(
+                file_path,
+                key,
+                metadata=metadata
+            )
         
         processing_time = time.time() - start_time
         
@@ -160,7 +250,8 @@ async def batch_upload_images(
     folder_prefix: Optional[str] = None,
     optimize: bool = True,
     quality: int = 80,
-    max_concurrent: int = 5
+    max_concurrent: int = 5,
+    max_concurrent_optimizations: Optional[int] = None
 ) -> BatchUploadResponse:
     """
     Upload multiple images in parallel to S3.
@@ -172,33 +263,38 @@ async def batch_upload_images(
         optimize: Enable image optimization (default: True)
         quality: Compression quality 1-100 (default: 80)
         max_concurrent: Maximum concurrent uploads (default: 5)
+        max_concurrent_optimizations: Maximum concurrent image optimizations
+            (default: CPU count)
         ctx: FastMCP Context for logging and progress reporting
     
     Returns:
         BatchUploadResponse: Batch upload result with URLs and status
     """
     start_time = time.time()
+    total_files = len(file_paths)
     
     try:
-        await ctx.info(f"Starting batch upload of {len(file_paths)} files to bucket {bucket_name}")
+        await ctx.info(f"Starting batch upload of {total_files} files to bucket {bucket_name}")
         
-        # Validate inputs
-        if not s3_client:
-            raise ValueError("S3 client not initialized")
-        if not image_processor:
-            raise ValueError("Image processor not initialized")
+        # Resolve services once; locals keep the hot path off globals
+        tool_context = get_tool_context(ctx)
+        if not tool_context:
+            raise ValueError("S3 client and image processor not initialized")
+        s3_client, image_processor = tool_context.s3, tool_context.images
         
         # Filter valid files
         valid_files = []
         errors = []
         
+        existing_files = await _find_existing(file_paths)
+        is_supported_format = image_processor.is_supported_format
         for file_path in file_paths:
-            if not os.path.exists(file_path):
+            if file_path not in existing_files:
                 errors.append(f"File not found: {file_path}")
                 continue
             
-            if not image_processor.is_supported_format(file_path):
-                errors.append(f"Unsupported format {Path(file_path).suffix}: {file_path}")
+            if not is_supported_format(file_path):
+                errors.append(f"Unsupported format {file_suffix(file_path)}: {file_path}")
                 continue
             
             valid_files.append(file_path)
@@ -207,115 +303,142 @@ async def batch_upload_images(
             return BatchUploadResponse(
                 success=False,
                 errors=errors,
-                total_files=len(file_paths),
+                total_files=total_files,
                 successful_uploads=0,
-                failed_uploads=len(file_paths)
+                failed_uploads=total_files
             )
         
         await ctx.info(f"Processing {len(valid_files)} valid files")
         
-        # Process images if optimization is enabled
-        processed_files = []
-        optimization_stats = None
+        # Encoding is CPU-bound and uploading is network-bound, so each
+        # gets its own limit instead of one shared cap stranding the other
+        optimize_limit = max_concurrent_optimizations or os.cpu_count() or 1
+        optimize_semaphore = asyncio.Semaphore(optimize_limit)
+        upload_semaphore = asyncio.Semaphore(max_concurrent)
         
-        if optimize:
-            await ctx.info("Optimizing images...")
+        keys = s3_client.generate_keys(valid_files, folder_prefix)
+        
+        async def process_one(entry: Tuple[int, str, str]) -> Dict[str, Any]:
+            # Each file is uploaded as soon as its own optimization finishes,
+            # so encoding and network transfer overlap across the batch
+            index, file_path, key = entry
+            metadata = {
+                'original_file': file_path,
+                'optimized': optimize,
+                'quality': str(quality),
+                'batch_index': str(index)
+            }
+            
+            if not optimize:
+                async with upload_semaphore:
+                    return {'upload': await s3_client.upload_file(file_path, key, metadata=metadata)}
+            
             try:
-                optimization_results = await image_processor.batch_optimize(
-                    valid_files,
-                    quality=quality,
-                    max_concurrent=max_concurrent
-                )
-                
-                # Update file paths to optimized versions
-                for result in optimization_results:
-                    if result.get('success', False):
-                        processed_files.append(result['output_path'])
-                    else:
-                        errors.append(f"Optimization failed for {result['file_path']}: {result.get('error', 'Unknown error')}")
-                
-                optimization_stats = image_processor.get_optimization_stats(optimization_results)
-                await ctx.info(f"Optimization complete: {optimization_stats['compression_ratio']:.1f}% compression")
-                
+                # Kept off the event loop, like the existence checks above
+                original_size = await asyncio.to_thread(os.path.getsize, file_path)
+                async with optimize_semaphore:
+                    optimized_data = await image_processor.optimize_image_bytes(
+                        file_path,
+                        quality=quality
+                    )
             except Exception as e:
-                await ctx.warning(f"Batch optimization failed, using original files: {e}")
-                processed_files = valid_files
-        else:
-            processed_files = valid_files
+                return {'optimization': {'success': False, 'file_path': file_path, 'error': str(e)}}
+            
+            async with upload_semaphore:
+                upload_result = await s3_client.upload_bytes(
+                    optimized_data, key, file_path, metadata=metadata
+                )
+            
+            return {
+                'optimization': {
+                    'success': True,
+                    'file_path': file_path,
+                    'original_size': original_size,
+                    'optimized_size': len(optimized_data)
+                },
+                'upload': upload_result
+            }
         
-        if not processed_files:
-            return BatchUploadResponse(
-                success=False,
-                errors=errors,
-                total_files=len(file_paths),
-                successful_uploads=0,
-                failed_uploads=len(file_paths),
-                optimization_stats=optimization_stats
-            )
+        completed = 0
+        last_report = float('-inf')
         
-        # Prepare upload tasks
-        upload_tasks = []
-        for i, file_path in enumerate(processed_files):
-            key = s3_client.generate_key(file_path, folder_prefix)
-            upload_tasks.append({
-                'file_path': file_path,
-                'key': key,
-                'metadata': {
-                    'original_file': file_paths[i] if i < len(file_paths) else file_path,
-                    'optimized': optimize,
-                    'quality': str(quality),
-                    'batch_index': str(i)
-                }
-            })
+        async def process_and_report(entry: Tuple[int, str, str]) -> Dict[str, Any]:
+            # Report files as they finish instead of only at the end, so
+            # clients see early results despite slow stragglers; each report
+            # is a client round-trip, so they are rate-limited (the final
+            # one is always sent)
+            nonlocal completed, last_report
+            try:
+                return await process_one(entry)
+            finally:
+                completed += 1
+                now = time.monotonic()
+                if completed == len(valid_files) or now - last_report >= PROGRESS_INTERVAL:
+                    last_report = now
+                    # A failed notification (e.g. the client went away) must
+                    # not replace the outcome of an upload that succeeded
+                    try:
+                        await ctx.report_progress(completed, len(valid_files))
+                    except Exception as e:
+                        logger.warning("Progress notification failed: %s", e)
         
-        # Upload files concurrently
-        await ctx.info(f"Uploading {len(upload_tasks)} files to S3...")
-        upload_results = await s3_client.upload_multiple(
-            upload_tasks,
-            max_concurrent=max_concurrent
+        await ctx.info(f"{'Optimizing and uploading' if optimize else 'Uploading'} {len(valid_files)} files to S3...")
+        outcomes = await bounded_map(
+            process_and_report,
+            ((i, p, k) for i, (p, k) in enumerate(zip(valid_files, keys))),
+            optimize_limit + max_concurrent
         )
         
         # Process results
         urls = []
         successful_uploads = 0
         detailed_results = []
+        optimization_results = []
         
-        for i, result in enumerate(upload_results):
+        for file_path, outcome in zip(valid_files, outcomes):
+            if isinstance(outcome, Exception):
+                outcome = {'upload': {'success': False, 'error': str(outcome)}}
+            
+            optimization = outcome.get('optimization')
+            if optimization is not None:
+                optimization_results.append(optimization)
+                if not optimization['success']:
+                    errors.append(f"Optimization failed for {file_path}: {optimization['error']}")
+            
+            result = outcome.get('upload')
+            if result is None:
+                continue
             if result.get('success', False):
                 urls.append(result['url'])
                 successful_uploads += 1
             else:
-                errors.append(f"Upload failed for {file_paths[i]}: {result.get('error', 'Unknown error')}")
+                errors.append(f"Upload failed for {file_path}: {result.get('error', 'Unknown error')}")
             
             detailed_results.append({
-                'file_path': file_paths[i] if i < len(file_paths) else processed_files[i],
+                'file_path': file_path,
                 'success': result.get('success', False),
                 'url': result.get('url'),
                 'error': result.get('error'),
                 'key': result.get('key')
             })
         
-        # Clean up temporary optimized files
-        if optimize and processed_files != valid_files:
-            for processed_file in processed_files:
-                if processed_file not in valid_files and os.path.exists(processed_file):
-                    try:
-                        os.remove(processed_file)
-                    except Exception as e:
-                        await ctx.warning(f"Failed to clean up temporary file {processed_file}: {e}")
+        optimization_stats = None
+        if optimize:
+            optimization_stats = image_processor.get_optimization_stats(optimization_results)
+            await ctx.info(f"Optimization complete: {optimization_stats['compression_ratio']:.1f}% compression")
         
         processing_time = time.time() - start_time
         overall_success = successful_uploads > 0
         
-        await ctx.info(f"Batch upload complete: {successful_uploads}/{len(file_paths)} successful")
+        await ctx.info(f"Batch upload complete: {successful_uploads}/{total_files} successful")
         
         return BatchUploadResponse(
             success=overall_success,
             urls=urls,
             errors=errors,
-            total_files=len(file_paths),
+            total_files=total_files,
             successful_uploads=successful_uploads,
-            failed_uploads=len(file_paths) - successful_uploads,
+            failed_uploads=total_files - successful_uploads,
             processing_time=processing_time,
             optimization_stats=optimization_stats,
             results=detailed_results
@@ -330,9 +453,9 @@ async def batch_upload_images(
         return BatchUploadResponse(
             success=False,
             errors=[error_msg],
-            total_files=len(file_paths),
+            total_files=total_files,
             successful_uploads=0,
-            failed_uploads=len(file_paths),
+            failed_uploads=total_files,
             processing_time=processing_time
         )
 
@@ -350,13 +473,14 @@ async def list_s3_buckets(ctx: Context) -> BucketListResponse:
     try:
         await ctx.info("Fetching S3 bucket list")
         
-        if not s3_client:
+        tool_context = get_tool_context(ctx)
+        if not tool_context:
             return BucketListResponse(
                 success=False,
                 error="S3 client not initialized"
             )
         
-        buckets = await s3_client.list_buckets()
+        buckets = await tool_context.s3.list_buckets()
         
         await ctx.info(f"Found {len(buckets)} accessible buckets")
         
@@ -390,10 +514,16 @@ async def get_server_info(ctx: Context) -> ServerInfo:
     try:
         await ctx.info("Fetching server information")
         
-        return ServerInfo(
-            aws_region=s3_client.region if s3_client else None,
-            bucket_name=s3_client.bucket_name if s3_client else None
-        )
+        tool_context = get_tool_context(ctx)
+        if not tool_context:
+            return ServerInfo(aws_region=None, bucket_name=None)
+        
+        if tool_context.server_info is None:
+            tool_context.server_info = ServerInfo(
+                aws_region=tool_context.s3.region,
+                bucket_name=tool_context.s3.bucket_name
+            )
+        return tool_context.server_info
         
     except Exception as e:
         error_msg = f"Error getting server info: {str(e)}"
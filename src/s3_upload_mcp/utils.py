@@ -0,0 +1,141 @@
+"""
+Shared Utilities for MCP Server
+
+Small helpers used by both the image processor and the S3 client.
+"""
+
+import os
+import asyncio
+import hashlib
+from typing import (
+    AsyncIterable, Awaitable, Callable, Dict, Iterable, List, Tuple, TypeVar, Union
+)
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+# Read size for streaming file hashes
+DIGEST_CHUNK_SIZE = 1024 * 1024
+
+
+def file_suffix(file_path: str) -> str:
+    """
+    Get a path's lowercase extension without building a Path object.
+    
+    Equivalent to Path(file_path).suffix.lower().
+    
+    Args:
+        file_path: File path
+        
+    Returns:
+        str: Extension including the dot (e.g. ".png"), or "" if none
+    """
+    stem, _, ext = os.path.basename(file_path).rpartition('.')
+    if not stem or not ext:
+        return ''
+    return '.' + ext.lower()
+
+
+def file_digest(file_path: str, *salt: object) -> str:
+    """
+    Compute a content hash of a file without loading it into memory.
+    
+    Args:
+        file_path: Path to the file
+        *salt: Extra values (e.g. optimization settings) mixed into the hash
+        
+    Returns:
+        str: Hex digest (BLAKE2b, 128-bit)
+    """
+    digest = _new_digest(salt)
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(DIGEST_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def bytes_digest(data: bytes, *salt: object) -> str:
+    """
+    Compute a content hash of in-memory data.
+    
+    Matches file_digest for a file holding the same bytes and salt.
+    
+    Args:
+        data: Content to hash
+        *salt: Extra values mixed into the hash
+        
+    Returns:
+        str: Hex digest (BLAKE2b, 128-bit)
+    """
+    digest = _new_digest(salt)
+    digest.update(data)
+    return digest.hexdigest()
+
+
+def _new_digest(salt: Tuple[object, ...]) -> 'hashlib.blake2b':
+    """Create a BLAKE2b hasher primed with salt values."""
+    digest = hashlib.blake2b(digest_size=16)
+    if salt:
+        # One delimited repr, so (80, 1920) and (801, 920) differ
+        digest.update(repr(tuple(salt)).encode())
+    return digest
+
+
+async def bounded_map(
+    func: Callable[[T], Awaitable[R]],
+    items: Union[Iterable[T], AsyncIterable[T]],
+    max_concurrent: int
+) -> List[Union[R, Exception]]:
+    """
+    Await func(item) for every item with a fixed pool of worker coroutines.
+    
+    Items are fed through a bounded queue, so only O(max_concurrent)
+    coroutines are alive at once regardless of how many items there are,
+    and a lazy (async) iterable is only consumed as workers free up.
+    
+    Args:
+        func: Coroutine function applied to each item
+        items: Items to process (iterable or async iterable)
+        max_concurrent: Number of worker coroutines
+        
+    Returns:
+        Results in input order; an exception raised by func is returned in
+        place of its result (like asyncio.gather(return_exceptions=True))
+    """
+    max_concurrent = max(1, max_concurrent)
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max_concurrent * 2)
+    results: Dict[int, Union[R, Exception]] = {}
+    
+    async def worker() -> None:
+        while True:
+            entry = await queue.get()
+            if entry is None:
+                return
+            index, item = entry
+            try:
+                results[index] = await func(item)
+            except Exception as e:
+                results[index] = e
+    
+    async def produce() -> int:
+        count = 0
+        if isinstance(items, AsyncIterable):
+            async for item in items:
+                await queue.put((count, item))
+                count += 1
+        else:
+            for count, item in enumerate(items, start=1):
+                await queue.put((count - 1, item))
+        for _ in range(max_concurrent):
+            await queue.put(None)
+        return count
+    
+    workers = [asyncio.ensure_future(worker()) for _ in range(max_concurrent)]
+    try:
+        count = await produce()
+        await asyncio.gather(*workers)
+    finally:
+        for task in workers:
+            task.cancel()
+    
+    return [results[i] for i in range(count)]
@@ -5,8 +5,9 @@ Pytest configuration and fixtures for S3 Upload MCP Server tests
 import os
 import tempfile
 import pytest
-from unittest.mock import Mock, AsyncMock
+from unittest.mock import Mock, AsyncMock, patch
 from pathlib import Path
+from botocore.hooks import HierarchicalEmitter
 
 # Add src to Python path
 import sys
@@ -16,6 +17,20 @@ from s3_upload_mcp.s3_client import S3Client
 from s3_upload_mcp.image_processor import ImageProcessor
 
 
+@pytest.fixture(scope="session", autouse=True)
+def pillow_plugins():
+    """Register every Pillow codec once instead of lazily on first use."""
+    from PIL import Image
+    
+    Image.init()
+
+
+@pytest.fixture(scope="session")
+def image_processor():
+    """Share one stateless default ImageProcessor across the test session."""
+    return ImageProcessor()
+
+
 @pytest.fixture
 def temp_dir():
     """Create a temporary directory for test files."""
@@ -23,18 +38,29 @@ def temp_dir():
         yield tmpdir
 
 
-@pytest.fixture
-def sample_image_path(temp_dir):
-    """Create a sample image file for testing."""
+@pytest.fixture(scope="session")
+def sample_image_path(tmp_path_factory):
+    """Create a sample image file shared by the whole test session."""
     # Create a simple test image using PIL
     from PIL import Image
     
-    image_path = os.path.join(temp_dir, "test_image.png")
+    image_path = tmp_path_factory.mktemp("images") / "test_image.png"
     # Create a simple 100x100 red image
     img = Image.new('RGB', (100, 100), color='red')
     img.save(image_path)
     
-    return image_path
+    return str(image_path)
+
+
+@pytest.fixture
+def boto_mock():
+    """Patch boto3.client to return a mock low-level S3 client."""
+    mock_client = Mock()
+    mock_client.list_buckets = Mock(return_value={'Buckets': []})
+    # A real emitter, so tests can fire the botocore events S3Client hooks
+    mock_client.meta.events = HierarchicalEmitter()
+    with patch('boto3.client', return_value=mock_client) as mock_boto:
+        yield mock_boto, mock_client
 
 
 @pytest.fixture
@@ -53,6 +79,15 @@ def mock_s3_client():
         'content_type': 'image/png',
         'metadata': {}
     })
+    client.upload_bytes = AsyncMock(return_value={
+        'success': True,
+        'url': 'https://test-bucket.s3.us-east-1.amazonaws.com/test-key',
+        'key': 'test-key',
+        'bucket': 'test-bucket',
+        'size': 512,
+        'content_type': 'image/png',
+        'metadata': {}
+    })
     client.upload_multiple = AsyncMock(return_value=[
         {
             'success': True,
@@ -67,6 +102,7 @@ def mock_s3_client():
     ])
     client.list_buckets = AsyncMock(return_value=['test-bucket', 'another-bucket'])
     client.generate_key = Mock(return_value='test-key')
+    client.generate_keys = Mock(side_effect=lambda file_paths, folder_prefix=None: ['test-key'] * len(file_paths))
     return client
 
 
@@ -84,6 +120,7 @@ def mock_image_processor():
         'has_transparency': False
     })
     processor.optimize_image = AsyncMock(return_value='/tmp/optimized_image.png')
+    processor.optimize_image_bytes = AsyncMock(return_value=b'optimized image bytes')
     processor.batch_optimize = AsyncMock(return_value=[
         {
             'success': True,
@@ -6,13 +6,16 @@ Run with: pytest tests/integration/ -m aws
 """
 
 import pytest
+import pytest_asyncio
 import os
 import tempfile
 from pathlib import Path
 
 from s3_upload_mcp.s3_client import S3Client
 from s3_upload_mcp.image_processor import ImageProcessor
-from s3_upload_mcp.tools import upload_image_to_s3, batch_upload_images, list_s3_buckets
+from s3_upload_mcp.tools import (
+    upload_image_to_s3, batch_upload_images, list_s3_buckets, ToolContext, TOOL_CONTEXT_KEY
+)
 from fastmcp import Context
 
 
@@ -33,26 +36,20 @@ class TestS3Integration:
             'bucket': os.getenv('S3_BUCKET_NAME', 'test-s3-upload-mcp')
         }
     
-    @pytest.fixture(scope="class")
-    def s3_client(self, aws_credentials):
+    @pytest_asyncio.fixture(scope="class")
+    async def s3_client(self, aws_credentials):
         """Create S3 client for integration tests."""
-        client = S3Client(
+        # Created on the session event loop the tests also run on, so
+        # the connection pool is reused instead of torn down per loop
+        async with S3Client(
             region=aws_credentials['region'],
             bucket_name=aws_credentials['bucket']
-        )
-        
-        # Test connection
-        import asyncio
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            connected = loop.run_until_complete(client.test_connection())
-            if not connected:
+        ) as client:
+            # Test connection
+            if not await client.test_connection():
                 pytest.skip("Cannot connect to S3 bucket")
-        finally:
-            loop.close()
-        
-        return client
+            
+            yield client
     
     @pytest.fixture(scope="class")
     def image_processor(self):
@@ -73,13 +70,11 @@ class TestS3Integration:
         # Cleanup
         os.unlink(tmp.name)
     
-    @pytest.mark.asyncio
     async def test_s3_client_connection(self, s3_client):
         """Test S3 client connection."""
         connected = await s3_client.test_connection()
         assert connected is True
     
-    @pytest.mark.asyncio
     async def test_s3_client_upload(self, s3_client, test_image):
         """Test S3 file upload."""
         key = f"integration-test/{Path(test_image).name}"
@@ -95,7 +90,6 @@ class TestS3Integration:
         assert result['key'] == key
         assert result['bucket'] == s3_client.bucket_name
     
-    @pytest.mark.asyncio
     async def test_s3_client_list_buckets(self, s3_client):
         """Test S3 bucket listing."""
         buckets = await s3_client.list_buckets()
@@ -104,7 +98,6 @@ class TestS3Integration:
         assert len(buckets) > 0
         assert s3_client.bucket_name in buckets
     
-    @pytest.mark.asyncio
     async def test_image_processor_optimization(self, image_processor, test_image):
         """Test image optimization."""
         with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as tmp:
@@ -130,14 +123,11 @@ class TestS3Integration:
             if os.path.exists(output_path):
                 os.unlink(output_path)
     
-    @pytest.mark.asyncio
     async def test_upload_tool_integration(self, s3_client, image_processor, test_image):
         """Test upload tool with real S3."""
-        from s3_upload_mcp.tools import set_global_instances
-        set_global_instances(s3_client, image_processor)
-        
         # Mock context
         class MockContext:
+            lifespan_context = {TOOL_CONTEXT_KEY: ToolContext(s3_client, image_processor)}
             async def info(self, msg): print(f"INFO: {msg}")
             async def warning(self, msg): print(f"WARNING: {msg}")
             async def error(self, msg): print(f"ERROR: {msg}")
@@ -157,12 +147,8 @@ class TestS3Integration:
         assert result.url is not None
         assert result.bucket == s3_client.bucket_name
     
-    @pytest.mark.asyncio
     async def test_batch_upload_tool_integration(self, s3_client, image_processor, test_image):
         """Test batch upload tool with real S3."""
-        from s3_upload_mcp.tools import set_global_instances
-        set_global_instances(s3_client, image_processor)
-        
         # Create multiple test images
         test_images = []
         for i in range(3):
@@ -175,9 +161,11 @@ class TestS3Integration:
         try:
             # Mock context
             class MockContext:
+                lifespan_context = {TOOL_CONTEXT_KEY: ToolContext(s3_client, image_processor)}
                 async def info(self, msg): print(f"INFO: {msg}")
                 async def warning(self, msg): print(f"WARNING: {msg}")
                 async def error(self, msg): print(f"ERROR: {msg}")
+                async def report_progress(self, progress, total): print(f"PROGRESS: {progress}/{total}")
             
             mock_ctx = MockContext()
             
@@ -203,14 +191,11 @@ class TestS3Integration:
                 if os.path.exists(img_path):
                     os.unlink(img_path)
     
-    @pytest.mark.asyncio
-    async def test_list_buckets_tool_integration(self, s3_client):
+    async def test_list_buckets_tool_integration(self, s3_client, image_processor):
         """Test list buckets tool with real S3."""
-        from s3_upload_mcp.tools import set_global_instances
-        set_global_instances(s3_client, None)
-        
         # Mock context
         class MockContext:
+            lifespan_context = {TOOL_CONTEXT_KEY: ToolContext(s3_client, image_processor)}
             async def info(self, msg): print(f"INFO: {msg}")
             async def error(self, msg): print(f"ERROR: {msg}")
         
@@ -4,37 +4,66 @@ Unit tests for ImageProcessor
 
 import pytest
 import os
+import shutil
+from io import BytesIO
+from pathlib import Path
 from unittest.mock import Mock, patch, AsyncMock
-from s3_upload_mcp.image_processor import ImageProcessor
+from PIL import Image
+from s3_upload_mcp.image_processor import (
+    ImageProcessor, _get_image_pool, _process_image, _process_image_bytes, _prune_cache
+)
 
 
 class TestImageProcessor:
     """Test cases for ImageProcessor class."""
     
-    def test_init(self):
+    def test_init(self, image_processor):
         """Test ImageProcessor initialization."""
-        processor = ImageProcessor()
-        assert processor is not None
+        assert image_processor is not None
     
-    def test_is_supported_format(self):
+    def test_image_pool_does_not_fork(self):
+        """Test workers are not forked from the threaded server process."""
+        with patch('s3_upload_mcp.image_processor._IMG_POOL', None), \
+             patch('s3_upload_mcp.image_processor.ProcessPoolExecutor') as mock_pool:
+            _get_image_pool()
+        
+        start_method = mock_pool.call_args.kwargs['mp_context'].get_start_method()
+        assert start_method in ('forkserver', 'spawn')
+    
+    async def test_async_context_manager_closes(self):
+        """Test leaving the context shuts down the worker pool."""
+        with patch('s3_upload_mcp.image_processor._shutdown_image_pool') as mock_shutdown:
+            async with ImageProcessor() as processor:
+                assert isinstance(processor, ImageProcessor)
+        
+        mock_shutdown.assert_called_once()
+    
+    @pytest.mark.parametrize("filename,expected", [
+        ("test.png", True),
+        ("test.jpg", True),
+        ("test.jpeg", True),
+        ("test.gif", True),
+        ("test.webp", True),
+        ("test.bmp", True),
+        ("test.tiff", True),
+        ("test.svg", True),
+        ("test.txt", False),
+        ("test.unknown", False),
+    ])
+    def test_is_supported_format(self, image_processor, filename, expected):
         """Test supported format detection."""
-        processor = ImageProcessor()
-        
-        assert processor.is_supported_format("test.png") is True
-        assert processor.is_supported_format("test.jpg") is True
-        assert processor.is_supported_format("test.jpeg") is True
-        assert processor.is_supported_format("test.gif") is True
-        assert processor.is_supported_format("test.webp") is True
-        assert processor.is_supported_format("test.bmp") is True
-        assert processor.is_supported_format("test.tiff") is True
-        assert processor.is_supported_format("test.svg") is True
-        assert processor.is_supported_format("test.txt") is False
-        assert processor.is_supported_format("test.unknown") is False
-    
-    def test_get_image_info(self, sample_image_path):
+        assert image_processor.is_supported_format(filename) is expected
+    
+    @pytest.mark.parametrize("extension", sorted(ImageProcessor.SUPPORTED_FORMATS))
+    def test_is_supported_format_matches_constant(self, image_processor, extension):
+        """Test every listed extension is accepted regardless of case."""
+        assert image_processor.is_supported_format(f"dir/image{extension}") is True
+        assert image_processor.is_supported_format(f"dir/IMAGE{extension.upper()}") is True
+        assert image_processor.is_supported_format(f"dir/image{extension}.txt") is False
+    
+    def test_get_image_info(self, image_processor, sample_image_path):
         """Test getting image information."""
-        processor = ImageProcessor()
-        info = processor.get_image_info(sample_image_path)
+        info = image_processor.get_image_info(sample_image_path)
         
         assert 'width' in info
         assert 'height' in info
@@ -45,20 +74,17 @@ class TestImageProcessor:
         assert info['width'] == 100
         assert info['height'] == 100
     
-    def test_get_image_info_invalid_file(self):
+    def test_get_image_info_invalid_file(self, image_processor):
         """Test getting image info for invalid file."""
-        processor = ImageProcessor()
-        info = processor.get_image_info("nonexistent.png")
+        info = image_processor.get_image_info("nonexistent.png")
         
         assert info == {}
     
-    @pytest.mark.asyncio
-    async def test_optimize_image(self, sample_image_path, temp_dir):
+    async def test_optimize_image(self, image_processor, sample_image_path, temp_dir):
         """Test image optimization."""
-        processor = ImageProcessor()
         output_path = os.path.join(temp_dir, "optimized.png")
         
-        result_path = await processor.optimize_image(
+        result_path = await image_processor.optimize_image(
             sample_image_path,
             output_path,
             quality=80
@@ -67,13 +93,21 @@ class TestImageProcessor:
         assert result_path == output_path
         assert os.path.exists(result_path)
     
-    @pytest.mark.asyncio
-    async def test_optimize_image_webp_conversion(self, sample_image_path, temp_dir):
+    @pytest.fixture
+    def mock_save(self):
+        """Run optimizations in-process with Pillow's encoder stubbed out."""
+        def save(img, fp, format=None, **params):
+            open(fp, 'wb').close()
+        
+        with patch('s3_upload_mcp.image_processor._get_image_pool', return_value=None), \
+             patch.object(Image.Image, 'save', autospec=True, side_effect=save) as mock:
+            yield mock
+    
+    async def test_optimize_image_webp_conversion(self, image_processor, sample_image_path, temp_dir, mock_save):
         """Test image optimization with WebP conversion."""
-        processor = ImageProcessor()
         output_path = os.path.join(temp_dir, "optimized.webp")
         
-        result_path = await processor.optimize_image(
+        result_path = await image_processor.optimize_image(
             sample_image_path,
             output_path,
             quality=80,
@@ -82,15 +116,16 @@ class TestImageProcessor:
         
         assert result_path == output_path
         assert os.path.exists(result_path)
-        assert result_path.endswith('.webp')
+        mock_save.assert_called_once()
+        img, target, image_format = mock_save.call_args.args
+        assert (target, image_format) == (output_path, 'WEBP')
+        assert mock_save.call_args.kwargs['quality'] == 80
     
-    @pytest.mark.asyncio
-    async def test_optimize_image_with_resize(self, sample_image_path, temp_dir):
+    async def test_optimize_image_with_resize(self, image_processor, sample_image_path, temp_dir, mock_save):
         """Test image optimization with resizing."""
-        processor = ImageProcessor()
         output_path = os.path.join(temp_dir, "resized.png")
         
-        result_path = await processor.optimize_image(
+        result_path = await image_processor.optimize_image(
             sample_image_path,
             output_path,
             quality=80,
@@ -99,42 +134,305 @@ class TestImageProcessor:
         )
         
         assert result_path == output_path
-        assert os.path.exists(result_path)
+        mock_save.assert_called_once()
+        img, target, image_format = mock_save.call_args.args
+        assert image_format == 'PNG'
+        # Check the encoded image was resized
+        assert img.width <= 50
+        assert img.height <= 50
+    
+    async def test_optimize_image_skips_small_input(self, image_processor, sample_image_path):
+        """Test small, in-bounds images are returned without re-encoding."""
+        with patch('s3_upload_mcp.image_processor._get_image_pool') as mock_pool:
+            result_path = await image_processor.optimize_image(sample_image_path)
         
-        # Check if image was resized
-        info = processor.get_image_info(result_path)
-        assert info['width'] <= 50
-        assert info['height'] <= 50
+        assert result_path == sample_image_path
+        mock_pool.assert_not_called()
     
-    def test_normalize_filename(self):
-        """Test filename normalization."""
-        processor = ImageProcessor()
+    async def test_optimize_image_does_not_write_through_links(self, image_processor, sample_image_path, temp_dir):
+        """Test re-optimizing into a linked output leaves the original intact."""
+        output_path = os.path.join(temp_dir, "linked.png")
+        original_bytes = Path(sample_image_path).read_bytes()
+        
+        await image_processor.optimize_image(sample_image_path, output_path)
+        await image_processor.optimize_image(sample_image_path, output_path, max_width=50, max_height=50)
+        
+        assert Path(sample_image_path).read_bytes() == original_bytes
+        assert image_processor.get_image_info(output_path)['width'] == 50
+    
+    async def test_optimize_image_cache_hit(self, sample_image_path, temp_dir):
+        """Test identical inputs and settings reuse the cached output."""
+        processor = ImageProcessor(cache_dir=os.path.join(temp_dir, "cache"))
+        first_path = os.path.join(temp_dir, "first.webp")
+        second_path = os.path.join(temp_dir, "second.webp")
+        
+        await processor.optimize_image(sample_image_path, first_path, convert_to_webp=True)
+        with patch('s3_upload_mcp.image_processor._get_image_pool') as mock_pool:
+            await processor.optimize_image(sample_image_path, second_path, convert_to_webp=True)
+        
+        mock_pool.assert_not_called()
+        assert Path(second_path).read_bytes() == Path(first_path).read_bytes()
+    
+    async def test_optimize_image_cache_hit_marks_entry_used(self, sample_image_path, temp_dir):
+        """Test cache hits refresh the entry's mtime for LRU eviction."""
+        processor = ImageProcessor(cache_dir=os.path.join(temp_dir, "cache"))
+        
+        await processor.optimize_image_bytes(sample_image_path, convert_to_webp=True)
+        entry_path = os.path.join(processor.cache_dir, os.listdir(processor.cache_dir)[0])
+        os.utime(entry_path, ns=(0, 0))
+        await processor.optimize_image_bytes(sample_image_path, convert_to_webp=True)
         
+        assert os.stat(entry_path).st_mtime_ns > 0
+    
+    async def test_optimize_image_cache_entry_points_and_backends(self, sample_image_path, temp_dir):
+        """Test file and bytes outputs, and each backend, use separate entries."""
+        processor = ImageProcessor(cache_dir=os.path.join(temp_dir, "cache"))
+        output_path = os.path.join(temp_dir, "cached.webp")
+        
+        await processor.optimize_image(sample_image_path, output_path, convert_to_webp=True)
+        with patch('s3_upload_mcp.image_processor._get_image_pool', return_value=None), \
+             patch('s3_upload_mcp.image_processor._process_image_bytes',
+                   wraps=_process_image_bytes) as mock_process:
+            await processor.optimize_image_bytes(sample_image_path, convert_to_webp=True)
+            await processor.optimize_image_bytes(sample_image_path, convert_to_webp=True)
+            with patch('s3_upload_mcp.image_processor._backend', return_value='vips'):
+                await processor.optimize_image_bytes(sample_image_path, convert_to_webp=True)
+        
+        assert mock_process.call_count == 2
+        assert len(os.listdir(processor.cache_dir)) == 3
+    
+    def test_prune_cache_evicts_least_recently_used(self, temp_dir):
+        """Test the oldest entries are deleted until the cache fits its cap."""
+        for name, mtime in (("a.png", 3), ("b.png", 1), ("c.png", 2), ("d.png.1.2.tmp", 0)):
+            path = os.path.join(temp_dir, name)
+            Path(path).write_bytes(b'x' * 100)
+            os.utime(path, ns=(mtime, mtime))
+        
+        _prune_cache(temp_dir, 250)
+        
+        assert sorted(os.listdir(temp_dir)) == ["a.png", "c.png", "d.png.1.2.tmp"]
+    
+    async def test_optimize_image_large_jpeg(self, image_processor, temp_dir):
+        """Test optimization of a JPEG much larger than the target size."""
+        input_path = os.path.join(temp_dir, "large.jpg")
+        Image.new('RGB', (800, 600), color='green').save(input_path, 'JPEG')
+        output_path = os.path.join(temp_dir, "large_optimized.jpg")
+        
+        result_path = await image_processor.optimize_image(
+            input_path,
+            output_path,
+            max_width=100,
+            max_height=100
+        )
+        
+        info = image_processor.get_image_info(result_path)
+        assert info['width'] == 100
+        assert info['height'] == 75
+    
+    async def test_optimize_image_bytes(self, image_processor, sample_image_path):
+        """Test in-memory optimization writes no output file."""
+        sample_dir = os.path.dirname(sample_image_path)
+        entries = sorted(os.listdir(sample_dir))
+        
+        with patch('s3_upload_mcp.image_processor._get_image_pool', return_value=None):
+            data = await image_processor.optimize_image_bytes(
+                sample_image_path,
+                max_width=50,
+                max_height=50
+            )
+        
+        with Image.open(BytesIO(data)) as img:
+            assert img.format == 'PNG'
+            assert img.size == (50, 50)
+        assert sorted(os.listdir(sample_dir)) == entries
+    
+    async def test_optimize_image_bytes_skips_small_input(self, image_processor, sample_image_path):
+        """Test small, in-bounds images are returned as their own bytes."""
+        with patch('s3_upload_mcp.image_processor._get_image_pool') as mock_pool:
+            data = await image_processor.optimize_image_bytes(sample_image_path)
+        
+        mock_pool.assert_not_called()
+        assert data == Path(sample_image_path).read_bytes()
+    
+    async def test_optimize_image_strips_gps_from_small_input(self, image_processor, temp_dir):
+        """Test small images carrying EXIF are re-encoded, not uploaded as-is."""
+        input_path = os.path.join(temp_dir, "gps.jpg")
+        exif = Image.Exif()
+        exif[271] = 'PhoneMaker'
+        exif.get_ifd(0x8825)[1] = 'N'  # GPSLatitudeRef
+        Image.new('RGB', (64, 64), color='blue').save(input_path, 'JPEG', exif=exif)
+        output_path = os.path.join(temp_dir, "gps_optimized.jpg")
+        
+        data = await image_processor.optimize_image_bytes(input_path)
+        result_path = await image_processor.optimize_image(input_path)
+        await image_processor.optimize_image(input_path, output_path)
+        
+        assert result_path != input_path
+        for source in (BytesIO(data), result_path, output_path):
+            with Image.open(source) as img:
+                assert dict(img.getexif()) == {}
+    
+    def test_process_image_bytes_keeps_smaller_original(self, temp_dir):
+        """Test re-encodes that do not shrink an image are discarded."""
+        input_path = os.path.join(temp_dir, "compressed.jpg")
+        Image.effect_noise((64, 64), 64).convert('RGB').save(input_path, 'JPEG', quality=10)
+        original_bytes = Path(input_path).read_bytes()
+        
+        assert _process_image_bytes(input_path, 95, 100, 100, False) == original_bytes
+        # Conversions and resizes always use the new encoding
+        assert _process_image_bytes(input_path, 95, 100, 100, True) != original_bytes
+        assert _process_image_bytes(input_path, 95, 32, 32, False) != original_bytes
+    
+    @pytest.mark.parametrize("filename", ["gps.jpg", "gps.png"])
+    def test_process_image_bytes_kept_original_has_no_exif(self, temp_dir, filename):
+        """Test the kept original is stripped of EXIF but not re-encoded."""
+        input_path = os.path.join(temp_dir, filename)
+        exif = Image.Exif()
+        exif[271] = 'PhoneMaker'
+        exif.get_ifd(0x8825)[1] = 'N'  # GPSLatitudeRef
+        noise = Image.effect_noise((64, 64), 64).convert('RGB')
+        noise.save(input_path, exif=exif, quality=10)
+        with Image.open(input_path) as img:
+            original_pixels = img.tobytes()
+        
+        data = _process_image_bytes(input_path, 95, 100, 100, False)
+        
+        assert b'PhoneMaker' not in data
+        with Image.open(BytesIO(data)) as img:
+            assert dict(img.getexif()) == {}
+            assert 'exif' not in img.info
+            assert img.tobytes() == original_pixels
+    
+    def test_process_image_resize(self, image_processor, sample_image_path, temp_dir):
+        """Test synchronous worker resizes in-process."""
+        output_path = os.path.join(temp_dir, "worker.png")
+        
+        result_path = _process_image(sample_image_path, output_path, 80, 50, 50, False)
+        
+        assert result_path == output_path
+        info = image_processor.get_image_info(result_path)
+        assert info['width'] == 50
+        assert info['height'] == 50
+    
+    def test_process_image_jpeg_is_progressive(self, temp_dir):
+        """Test JPEG output is saved progressive."""
+        input_path = os.path.join(temp_dir, "baseline.jpg")
+        Image.new('RGB', (200, 100), color='green').save(input_path, 'JPEG')
+        output_path = os.path.join(temp_dir, "progressive.jpg")
+        
+        _process_image(input_path, output_path, 80, 100, 100, False)
+        data = _process_image_bytes(input_path, 80, 100, 100, False)
+        
+        for source in (output_path, BytesIO(data)):
+            with Image.open(source) as img:
+                assert img.info.get('progressive')
+    
+    @pytest.mark.parametrize("filename,convert_to_webp,expected_calls", [
+        ("input.jpg", False, 1),
+        ("input.png", False, 0),
+        ("input.png", True, 0),
+    ])
+    def test_process_image_mozjpeg_only_for_jpeg(self, temp_dir, filename, convert_to_webp, expected_calls):
+        """Test MozJPEG post-processing runs for JPEG output only."""
+        input_path = os.path.join(temp_dir, filename)
+        Image.new('RGB', (200, 100), color='green').save(input_path)
+        output_path = os.path.join(temp_dir, "output" + ('.webp' if convert_to_webp else Path(filename).suffix))
+        mozjpeg = Mock()
+        mozjpeg.optimize.side_effect = lambda data: data
+        
+        with patch('s3_upload_mcp.image_processor.mozjpeg_lossless_optimization', mozjpeg):
+            _process_image(input_path, output_path, 80, 100, 100, convert_to_webp)
+            _process_image_bytes(input_path, 80, 100, 100, convert_to_webp)
+        
+        assert mozjpeg.optimize.call_count == 2 * expected_calls
+        for call in mozjpeg.optimize.call_args_list:
+            assert call.args[0].startswith(b'\xff\xd8')
+    
+    def test_process_image_webp_transparency(self, image_processor, temp_dir):
+        """Test synchronous worker flattens transparency for WebP."""
+        input_path = os.path.join(temp_dir, "alpha.png")
+        Image.new('RGBA', (40, 40), color=(255, 0, 0, 128)).save(input_path)
+        output_path = os.path.join(temp_dir, "alpha.webp")
+        
+        _process_image(input_path, output_path, 80, 100, 100, True)
+        
+        info = image_processor.get_image_info(output_path)
+        assert info['format'] == 'WEBP'
+        assert info['mode'] == 'RGB'
+    
+    def test_process_image_webp_opaque_rgba(self, image_processor, temp_dir):
+        """Test opaque RGBA sources convert to WebP without compositing."""
+        input_path = os.path.join(temp_dir, "opaque.png")
+        Image.new('RGBA', (40, 40), color=(0, 0, 255, 255)).save(input_path)
+        output_path = os.path.join(temp_dir, "opaque.webp")
+        
+        with patch('s3_upload_mcp.image_processor.Image.new') as mock_new:
+            _process_image(input_path, output_path, 80, 100, 100, True)
+        
+        mock_new.assert_not_called()
+        info = image_processor.get_image_info(output_path)
+        assert info['format'] == 'WEBP'
+        assert info['mode'] == 'RGB'
+    
+    def test_process_image_exif_rotation(self, image_processor, temp_dir):
+        """Test EXIF orientation is applied before resizing."""
+        input_path = os.path.join(temp_dir, "rotated.jpg")
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Rotate 90 CW
+        Image.new('RGB', (400, 200), color='blue').save(input_path, 'JPEG', exif=exif)
+        output_path = os.path.join(temp_dir, "rotated_optimized.jpg")
+        
+        _process_image(input_path, output_path, 80, 100, 100, False)
+        
+        info = image_processor.get_image_info(output_path)
+        assert info['width'] == 50
+        assert info['height'] == 100
+    
+    @pytest.mark.parametrize("filename,convert_to_webp", [
+        ("vips.jpg", False),
+        ("vips.png", False),
+        ("vips.webp", True),
+    ])
+    def test_process_image_vips(self, image_processor, sample_image_path, temp_dir, filename, convert_to_webp):
+        """Test the optional libvips backend."""
+        pytest.importorskip("pyvips")
+        output_path = os.path.join(temp_dir, filename)
+        
+        with patch.dict(os.environ, {'USE_VIPS': '1'}):
+            _process_image(sample_image_path, output_path, 80, 50, 50, convert_to_webp)
+        
+        info = image_processor.get_image_info(output_path)
+        assert info['width'] == 50
+        assert info['height'] == 50
+    
+    def test_normalize_filename(self, image_processor):
+        """Test filename normalization."""
         # Test basic normalization
-        assert processor.normalize_filename("test image.png") == "test_image.png"
-        assert processor.normalize_filename("test@#$%image.png") == "test_image.png"
-        assert processor.normalize_filename("test___image.png") == "test_image.png"
-        assert processor.normalize_filename("_test_image_.png") == "test_image_.png"
+        assert image_processor.normalize_filename("test image.png") == "test_image.png"
+        assert image_processor.normalize_filename("test@#$%image.png") == "test_image.png"
+        assert image_processor.normalize_filename("test___image.png") == "test_image.png"
+        assert image_processor.normalize_filename("_test_image_.png") == "test_image_.png"
+        assert image_processor.normalize_filename("디자인 test.png") == "test.png"
         
         # Test filename without extension
-        result = processor.normalize_filename("test")
+        result = image_processor.normalize_filename("test")
         assert result == "test.jpg"
     
-    @pytest.mark.asyncio
-    async def test_batch_optimize(self, sample_image_path, temp_dir):
+    async def test_batch_optimize(self, image_processor, sample_image_path, temp_dir):
         """Test batch image optimization."""
-        processor = ImageProcessor()
-        
         # Create multiple test images
         image_paths = []
         for i in range(3):
             path = os.path.join(temp_dir, f"test{i}.png")
-            # Copy the sample image
-            import shutil
-            shutil.copy2(sample_image_path, path)
+            # Hard-link the sample image; outputs go to new paths, so the
+            # shared inode is never written
+            try:
+                os.link(sample_image_path, path)
+            except OSError:
+                shutil.copy2(sample_image_path, path)
             image_paths.append(path)
         
-        results = await processor.batch_optimize(
+        results = await image_processor.batch_optimize(
             image_paths,
             quality=80,
             max_concurrent=2
@@ -144,27 +442,22 @@ class TestImageProcessor:
         assert all(result['success'] for result in results)
         assert all('output_path' in result for result in results)
     
-    @pytest.mark.asyncio
-    async def test_batch_optimize_with_errors(self, temp_dir):
+    async def test_batch_optimize_with_errors(self, image_processor, temp_dir):
         """Test batch optimization with invalid files."""
-        processor = ImageProcessor()
-        
         # Mix of valid and invalid files
         image_paths = [
             "nonexistent1.png",
             "nonexistent2.png"
         ]
         
-        results = await processor.batch_optimize(image_paths)
+        results = await image_processor.batch_optimize(image_paths)
         
         assert len(results) == 2
         assert all(not result['success'] for result in results)
         assert all('error' in result for result in results)
     
-    def test_get_optimization_stats(self):
+    def test_get_optimization_stats(self, image_processor):
         """Test optimization statistics calculation."""
-        processor = ImageProcessor()
-        
         results = [
             {
                 'success': True,
@@ -183,7 +476,7 @@ class TestImageProcessor:
             }
         ]
         
-        stats = processor.get_optimization_stats(results)
+        stats = image_processor.get_optimization_stats(results)
         
         assert stats['total_files'] == 3
         assert stats['successful'] == 2
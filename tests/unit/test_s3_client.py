@@ -2,149 +2,358 @@
 Unit tests for S3Client
 """
 
+import asyncio
 import pytest
 import os
+import time
 from unittest.mock import Mock, patch, AsyncMock
+from botocore.exceptions import ClientError
+from botocore.stub import Stubber
 from s3_upload_mcp.s3_client import S3Client
 
 
+def _completing_upload(error=None, events=None):
+    """
+    Fake TransferManager.upload that finishes the transfer immediately.
+    
+    With events, the PutObject call's botocore events are emitted too,
+    returning the key as its ETag.
+    """
+    def upload(fileobj, bucket, key, extra_args=None, subscribers=None):
+        future = Mock()
+        if error:
+            future.result.side_effect = error
+        elif events:
+            context = {}
+            events.emit(
+                'before-parameter-build.s3.PutObject', params={'Key': key}, model=None, context=context
+            )
+            events.emit(
+                'after-call.s3.PutObject',
+                http_response=None, parsed={'ETag': f'"{key}"'}, model=None, context=context
+            )
+        for subscriber in subscribers or []:
+            subscriber.on_done(future=future)
+        return future
+    return upload
+
+
 class TestS3Client:
     """Test cases for S3Client class."""
     
-    def test_init_with_credentials(self):
+    @pytest.fixture(autouse=True)
+    def transfer_manager(self):
+        """Keep the real (classic or CRT) transfer manager off mocked clients."""
+        with patch('s3_upload_mcp.s3_client.create_transfer_manager') as mock_tm:
+            yield mock_tm.return_value
+    
+    def test_init_with_credentials(self, boto_mock):
         """Test S3Client initialization with credentials."""
-        with patch('boto3.client') as mock_boto:
-            client = S3Client(region="us-east-1", bucket_name="test-bucket")
-            mock_boto.assert_called_once()
-            assert client.region == "us-east-1"
-            assert client.bucket_name == "test-bucket"
+        mock_boto, _ = boto_mock
+        client = S3Client(region="us-east-1", bucket_name="test-bucket")
+        mock_boto.assert_called_once()
+        assert client.region == "us-east-1"
+        assert client.bucket_name == "test-bucket"
     
-    def test_init_without_credentials(self):
+    def test_init_without_credentials(self, boto_mock):
         """Test S3Client initialization without credentials."""
-        with patch('boto3.client', side_effect=Exception("No credentials")):
-            with pytest.raises(Exception):
-                S3Client(region="us-east-1", bucket_name="test-bucket")
+        mock_boto, _ = boto_mock
+        mock_boto.side_effect = Exception("No credentials")
+        with pytest.raises(Exception):
+            S3Client(region="us-east-1", bucket_name="test-bucket")
     
-    @pytest.mark.asyncio
-    async def test_test_connection_success(self):
+    async def test_test_connection_success(self, boto_mock):
         """Test successful connection test."""
-        with patch('boto3.client') as mock_boto:
-            mock_client = Mock()
-            mock_client.head_bucket = Mock()
-            mock_boto.return_value = mock_client
-            
-            client = S3Client(region="us-east-1", bucket_name="test-bucket")
-            result = await client.test_connection()
-            
-            assert result is True
-            mock_client.head_bucket.assert_called_once_with(Bucket="test-bucket")
+        _, mock_client = boto_mock
+        client = S3Client(region="us-east-1", bucket_name="test-bucket")
+        result = await client.test_connection()
+        
+        assert result is True
+        mock_client.head_bucket.assert_called_once_with(Bucket="test-bucket")
     
-    @pytest.mark.asyncio
-    async def test_test_connection_failure(self):
+    async def test_test_connection_failure(self, boto_mock):
         """Test connection test failure."""
-        with patch('boto3.client') as mock_boto:
-            mock_client = Mock()
-            mock_client.head_bucket = Mock(side_effect=Exception("Access denied"))
-            mock_boto.return_value = mock_client
-            
-            client = S3Client(region="us-east-1", bucket_name="test-bucket")
-            result = await client.test_connection()
-            
-            assert result is False
+        _, mock_client = boto_mock
+        mock_client.head_bucket.side_effect = Exception("Access denied")
+        
+        client = S3Client(region="us-east-1", bucket_name="test-bucket")
+        result = await client.test_connection()
+        
+        assert result is False
     
-    @pytest.mark.asyncio
-    async def test_upload_file_success(self, temp_dir, sample_image_path):
+    async def test_upload_file_success(self, boto_mock, transfer_manager, sample_image_path):
         """Test successful file upload."""
-        with patch('boto3.client') as mock_boto:
-            mock_client = Mock()
-            mock_client.upload_file = Mock()
-            mock_boto.return_value = mock_client
-            
-            client = S3Client(region="us-east-1", bucket_name="test-bucket")
-            
-            with patch.object(client, '_get_content_type', return_value='image/png'):
-                result = await client.upload_file(
-                    sample_image_path,
-                    "test-key",
-                    metadata={'test': 'value'}
-                )
-            
-            assert result['success'] is True
-            assert 'url' in result
-            assert result['key'] == "test-key"
-            assert result['bucket'] == "test-bucket"
+        transfer_manager.upload.side_effect = _completing_upload()
+        client = S3Client(region="us-east-1", bucket_name="test-bucket")
+        
+        with patch.object(client, '_get_content_type', return_value='image/png'):
+            result = await client.upload_file(
+                sample_image_path,
+                "test-key",
+                metadata={'test': 'value'}
+            )
+        
+        assert result['success'] is True
+        assert 'url' in result
+        assert result['key'] == "test-key"
+        assert result['bucket'] == "test-bucket"
+        transfer_manager.upload.assert_called_once()
+        extra_args = transfer_manager.upload.call_args.kwargs['extra_args']
+        assert extra_args['ChecksumAlgorithm'] == 'CRC32'
     
-    @pytest.mark.asyncio
-    async def test_upload_file_failure(self, temp_dir, sample_image_path):
-        """Test file upload failure."""
-        with patch('boto3.client') as mock_boto:
-            mock_client = Mock()
-            mock_client.upload_file = Mock(side_effect=Exception("Upload failed"))
-            mock_boto.return_value = mock_client
-            
-            client = S3Client(region="us-east-1", bucket_name="test-bucket")
-            
+    async def test_upload_file_stats_once(self, boto_mock, transfer_manager, sample_image_path):
+        """Test the size and mtime of an upload come from a single stat."""
+        transfer_manager.upload.side_effect = _completing_upload()
+        client = S3Client(region="us-east-1", bucket_name="test-bucket")
+        
+        with patch('s3_upload_mcp.s3_client.os.stat', wraps=os.stat) as mock_stat:
             result = await client.upload_file(sample_image_path, "test-key")
-            
-            assert result['success'] is False
-            assert 'error' in result
+        
+        assert result['size'] == os.path.getsize(sample_image_path)
+        mock_stat.assert_called_once_with(sample_image_path)
+    
+    async def test_upload_file_duplicate_content_is_copied(self, boto_mock, transfer_manager, sample_image_path):
+        """Test re-uploading identical content uses a server-side copy."""
+        _, mock_client = boto_mock
+        transfer_manager.upload.side_effect = _completing_upload(events=mock_client.meta.events)
+        mock_client.copy_object.return_value = {'CopyObjectResult': {'ETag': '"key1"'}}
+        
+        client = S3Client(region="us-east-1", bucket_name="test-bucket")
+        first = await client.upload_file(sample_image_path, "key1")
+        second = await client.upload_file(sample_image_path, "key2")
+        third = await client.upload_file(sample_image_path, "key3")
+        
+        assert first['success'] is True
+        assert second['success'] is True
+        assert third['success'] is True
+        assert second['key'] == "key2"
+        transfer_manager.upload.assert_called_once()
+        assert mock_client.copy_object.call_count == 2
+        copy_args = mock_client.copy_object.call_args_list[0].kwargs
+        assert copy_args['CopySource'] == {'Bucket': 'test-bucket', 'Key': 'key1'}
+        assert copy_args['CopySourceIfMatch'] == '"key1"'
+    
+    async def test_upload_file_changed_copy_source_is_uploaded(self, boto_mock, transfer_manager, sample_image_path):
+        """Test a copy source overwritten elsewhere falls back to an upload."""
+        _, mock_client = boto_mock
+        transfer_manager.upload.side_effect = _completing_upload(events=mock_client.meta.events)
+        mock_client.copy_object.side_effect = ClientError(
+            {'Error': {'Code': 'PreconditionFailed', 'Message': 'Precondition failed'}},
+            'CopyObject'
+        )
+        
+        client = S3Client(region="us-east-1", bucket_name="test-bucket")
+        await client.upload_file(sample_image_path, "key1")
+        result = await client.upload_file(sample_image_path, "key2")
+        
+        assert result['success'] is True
+        mock_client.copy_object.assert_called_once()
+        assert transfer_manager.upload.call_count == 2
+    
+    async def test_upload_file_without_etag_is_not_copied(self, boto_mock, transfer_manager, sample_image_path):
+        """Test content whose ETag is unknown (e.g. CRT uploads) is re-uploaded."""
+        _, mock_client = boto_mock
+        transfer_manager.upload.side_effect = _completing_upload()
+        
+        client = S3Client(region="us-east-1", bucket_name="test-bucket")
+        await client.upload_file(sample_image_path, "key1")
+        await client.upload_file(sample_image_path, "key2")
+        
+        mock_client.copy_object.assert_not_called()
+        assert transfer_manager.upload.call_count == 2
+    
+    def test_upload_etags_are_read_from_botocore(self):
+        """Test ETags of upload calls are captured from real botocore events."""
+        client = S3Client(region="us-east-1", bucket_name="test-bucket")
+        
+        with Stubber(client.s3_client) as stubber:
+            stubber.add_response(
+                'put_object', {'ETag': '"abc"'}, {'Bucket': 'test-bucket', 'Key': 'key1', 'Body': b'x'}
+            )
+            client.s3_client.put_object(Bucket='test-bucket', Key='key1', Body=b'x')
+        
+        assert client._etags == {'key1': '"abc"'}
     
-    @pytest.mark.asyncio
-    async def test_upload_multiple(self, temp_dir, sample_image_path):
+    async def test_upload_file_overwritten_key_is_not_copied(self, boto_mock, transfer_manager, temp_dir):
+        """Test content is never copied from a key that was overwritten since."""
+        _, mock_client = boto_mock
+        transfer_manager.upload.side_effect = _completing_upload(events=mock_client.meta.events)
+        first_path = os.path.join(temp_dir, "a.png")
+        second_path = os.path.join(temp_dir, "b.png")
+        with open(first_path, 'wb') as f:
+            f.write(b'A' * 64)
+        with open(second_path, 'wb') as f:
+            f.write(b'B' * 64)
+        
+        client = S3Client(region="us-east-1", bucket_name="test-bucket")
+        await client.upload_file(first_path, "logo.png")
+        await client.upload_file(second_path, "logo.png")
+        result = await client.upload_file(first_path, "logo2.png")
+        
+        assert result['success'] is True
+        mock_client.copy_object.assert_not_called()
+        assert transfer_manager.upload.call_count == 3
+    
+    async def test_upload_file_unique_size_is_not_hashed(self, boto_mock, transfer_manager, temp_dir, sample_image_path):
+        """Test files are only hashed when an earlier upload had the same size."""
+        transfer_manager.upload.side_effect = _completing_upload()
+        other_path = os.path.join(temp_dir, "other.png")
+        with open(other_path, 'wb') as f:
+            f.write(b'other content')
+        
+        client = S3Client(region="us-east-1", bucket_name="test-bucket")
+        with patch('s3_upload_mcp.s3_client.file_digest') as mock_digest:
+            await client.upload_file(sample_image_path, "key1")
+            await client.upload_file(other_path, "key2")
+        
+        mock_digest.assert_not_called()
+    
+    async def test_upload_file_failure(self, boto_mock, transfer_manager, sample_image_path):
+        """Test file upload failure."""
+        transfer_manager.upload.side_effect = Exception("Upload failed")
+        client = S3Client(region="us-east-1", bucket_name="test-bucket")
+        
+        result = await client.upload_file(sample_image_path, "test-key")
+        
+        assert result['success'] is False
+        assert 'error' in result
+    
+    async def test_upload_file_transfer_error(self, boto_mock, transfer_manager, sample_image_path):
+        """Test failure reported by the transfer after submission."""
+        transfer_manager.upload.side_effect = _completing_upload(
+            Exception("Connection reset")
+        )
+        
+        client = S3Client(region="us-east-1", bucket_name="test-bucket")
+        result = await client.upload_file(sample_image_path, "test-key")
+        
+        assert result['success'] is False
+        assert "Connection reset" in result['error']
+    
+    async def test_upload_bytes(self, boto_mock, transfer_manager):
+        """Test in-memory content is streamed without a local file."""
+        transfer_manager.upload.side_effect = _completing_upload()
+        
+        client = S3Client(region="us-east-1", bucket_name="test-bucket")
+        result = await client.upload_bytes(b'image data', "test-key", "/tmp/photo.jpg")
+        
+        assert result['success'] is True
+        assert result['size'] == 10
+        assert result['content_type'] == 'image/jpeg'
+        assert result['metadata']['original_filename'] == 'photo.jpg'
+        fileobj = transfer_manager.upload.call_args[0][0]
+        assert fileobj.read() == b'image data'
+    
+    async def test_upload_multiple(self, boto_mock, transfer_manager, sample_image_path):
         """Test multiple file upload."""
-        with patch('boto3.client') as mock_boto:
-            mock_client = Mock()
-            mock_client.upload_file = Mock()
-            mock_boto.return_value = mock_client
-            
-            client = S3Client(region="us-east-1", bucket_name="test-bucket")
-            
-            files = [
-                {'file_path': sample_image_path, 'key': 'key1'},
-                {'file_path': sample_image_path, 'key': 'key2'}
-            ]
-            
-            with patch.object(client, '_get_content_type', return_value='image/png'):
-                results = await client.upload_multiple(files)
-            
-            assert len(results) == 2
-            assert all(result['success'] for result in results)
+        transfer_manager.upload.side_effect = _completing_upload()
+        client = S3Client(region="us-east-1", bucket_name="test-bucket")
+        
+        files = [
+            {'file_path': sample_image_path, 'key': 'key1'},
+            {'file_path': sample_image_path, 'key': 'key2'}
+        ]
+        
+        with patch.object(client, '_get_content_type', return_value='image/png'):
+            results = await client.upload_multiple(files)
+        
+        assert len(results) == 2
+        assert all(result['success'] for result in results)
     
-    @pytest.mark.asyncio
-    async def test_list_buckets(self):
+    async def test_upload_multiple_async_iterable(self, boto_mock, transfer_manager, sample_image_path):
+        """Test upload tasks can be streamed from an async generator."""
+        transfer_manager.upload.side_effect = _completing_upload()
+        client = S3Client(region="us-east-1", bucket_name="test-bucket")
+        
+        async def tasks():
+            yield {'file_path': sample_image_path, 'key': 'key1'}
+            yield {'file_path': 'missing.png', 'key': 'key2'}
+        
+        results = await client.upload_multiple(tasks())
+        
+        assert [result['key'] for result in results] == ['key1', 'key2']
+        assert results[0]['success'] is True
+        assert results[1]['success'] is False
+    
+    async def test_async_context_manager_closes(self, boto_mock, transfer_manager):
+        """Test leaving the context shuts down transfers and the client."""
+        _, mock_client = boto_mock
+        
+        async with S3Client(region="us-east-1", bucket_name="test-bucket") as client:
+            assert isinstance(client, S3Client)
+        
+        transfer_manager.shutdown.assert_called_once()
+        mock_client.close.assert_called_once()
+    
+    async def test_list_buckets(self, boto_mock):
         """Test listing S3 buckets."""
-        with patch('boto3.client') as mock_boto:
-            mock_client = Mock()
-            mock_client.list_buckets = Mock(return_value={
-                'Buckets': [
-                    {'Name': 'bucket1'},
-                    {'Name': 'bucket2'}
-                ]
-            })
-            mock_boto.return_value = mock_client
-            
+        _, mock_client = boto_mock
+        mock_client.list_buckets.return_value = {
+            'Buckets': [
+                {'Name': 'bucket1'},
+                {'Name': 'bucket2'}
+            ]
+        }
+        
+        client = S3Client(region="us-east-1", bucket_name="test-bucket")
+        buckets = await client.list_buckets()
+        
+        assert buckets == ['bucket1', 'bucket2']
+    
+    async def test_list_buckets_is_cached(self, boto_mock):
+        """Test bucket listings are reused until the TTL expires."""
+        _, mock_client = boto_mock
+        mock_client.list_buckets.return_value = {'Buckets': [{'Name': 'bucket1'}]}
+        
+        # Only the module's clock is frozen; the event loop keeps the real one
+        with patch('s3_upload_mcp.s3_client.time', Mock(wraps=time)) as mock_time:
+            mock_time.monotonic.return_value = 1000.0
             client = S3Client(region="us-east-1", bucket_name="test-bucket")
-            buckets = await client.list_buckets()
+            first, second = await asyncio.gather(client.list_buckets(), client.list_buckets())
+            
+            assert first == second == ['bucket1']
+            mock_client.list_buckets.assert_called_once()
             
-            assert buckets == ['bucket1', 'bucket2']
+            mock_time.monotonic.return_value = 1031.0
+            await client.list_buckets()
+            assert mock_client.list_buckets.call_count == 2
     
-    def test_get_content_type(self):
+    @pytest.mark.parametrize("filename,content_type", [
+        ("test.png", "image/png"),
+        ("test.jpg", "image/jpeg"),
+        ("test.unknown", "application/octet-stream"),
+    ])
+    def test_get_content_type(self, boto_mock, filename, content_type):
         """Test content type detection."""
-        with patch('boto3.client'):
-            client = S3Client(region="us-east-1", bucket_name="test-bucket")
-            
-            assert client._get_content_type("test.png") == "image/png"
-            assert client._get_content_type("test.jpg") == "image/jpeg"
-            assert client._get_content_type("test.unknown") == "application/octet-stream"
+        client = S3Client(region="us-east-1", bucket_name="test-bucket")
+        
+        assert client._get_content_type(filename) == content_type
     
-    def test_generate_key(self):
+    def test_generate_key(self, boto_mock):
         """Test S3 key generation."""
-        with patch('boto3.client'):
-            client = S3Client(region="us-east-1", bucket_name="test-bucket")
-            
-            key = client.generate_key("/path/to/image.png")
-            assert key.endswith(".png")
-            assert "image" in key
-            
-            key_with_prefix = client.generate_key("/path/to/image.png", "folder")
-            assert key_with_prefix.startswith("folder/")
+        client = S3Client(region="us-east-1", bucket_name="test-bucket")
+        
+        key = client.generate_key("/path/to/image.png")
+        assert key.endswith(".png")
+        assert "image" in key
+        
+        key_with_prefix = client.generate_key("/path/to/image.png", "folder")
+        assert key_with_prefix.startswith("folder/")
+        
+        # Unsafe characters are dropped from the name
+        assert client.generate_key("/path/to/my image!.png").startswith("myimage_")
+        
+        # Keys generated within the same second stay unique
+        assert client.generate_key("/path/to/image.png") != key
+    
+    def test_generate_keys(self, boto_mock):
+        """Test batch key generation."""
+        client = S3Client(region="us-east-1", bucket_name="test-bucket")
+        
+        keys = client.generate_keys(["/a/one.png", "/b/two!.jpg", "/a/one.png"], "folder/")
+        
+        assert len(keys) == 3
+        assert keys[0].startswith("folder/one_") and keys[0].endswith(".png")
+        assert keys[1].startswith("folder/two_") and keys[1].endswith(".jpg")
+        assert len(set(keys)) == 3
+        assert client.generate_keys([]) == []
@@ -2,127 +2,127 @@
 Unit tests for MCP Tools
 """
 
+import os
+import time
+import asyncio
+import unicodedata
 import pytest
-from unittest.mock import Mock, AsyncMock, patch
+from unittest.mock import DEFAULT, Mock, call, patch
 from fastmcp import Context
 
 from s3_upload_mcp.tools import (
     upload_image_to_s3, batch_upload_images, list_s3_buckets, get_server_info,
-    set_global_instances
+    ToolContext, TOOL_CONTEXT_KEY, get_tool_context, _find_existing
 )
 from s3_upload_mcp.models import UploadResponse, BatchUploadResponse, BucketListResponse
 
 
+def _upload_results(keys, bucket="test-bucket", region="us-east-1"):
+    """Build successful S3Client upload results for the given keys."""
+    return [
+        {'success': True, 'url': f"https://{bucket}.s3.{region}.amazonaws.com/{key}", 'key': key}
+        for key in keys
+    ]
+
+
 class TestMCPTools:
     """Test cases for MCP tools."""
     
     @pytest.fixture(autouse=True)
     def setup_tools(self, mock_s3_client, mock_image_processor):
-        """Set up global instances for tools."""
-        set_global_instances(mock_s3_client, mock_image_processor)
+        """Attach the mock services to every tool call."""
+        tool_context = ToolContext(s3=mock_s3_client, images=mock_image_processor)
+        with patch('s3_upload_mcp.tools.get_tool_context', return_value=tool_context):
+            yield
+    
+    @pytest.fixture
+    def mock_ctx(self):
+        """Context whose logging and progress methods are AsyncMocks."""
+        # spec_set=Context makes every async Context method an AsyncMock and
+        # rejects unknown attributes; built per test so nothing leaks
+        return Mock(spec_set=Context)
     
-    @pytest.mark.asyncio
-    async def test_upload_image_to_s3_success(self, sample_image_path, mock_s3_client, mock_image_processor):
+    @pytest.fixture
+    def fs_mock(self):
+        """Report every path as an existing 1KB file."""
+        with patch.multiple(os.path, exists=DEFAULT, getsize=DEFAULT) as mocks:
+            mocks["exists"].return_value = True
+            mocks["getsize"].return_value = 1024
+            yield mocks
+    
+    async def test_upload_image_to_s3_success(self, mock_ctx, fs_mock, sample_image_path, mock_s3_client, mock_image_processor):
         """Test successful single image upload."""
-        # Mock file existence
-        with patch('os.path.exists', return_value=True):
-            with patch('os.path.getsize', return_value=1024):
-                # Mock context
-                mock_ctx = Mock(spec=Context)
-                mock_ctx.info = AsyncMock()
-                mock_ctx.warning = AsyncMock()
-                mock_ctx.error = AsyncMock()
-                
-                result = await upload_image_to_s3(
-                    sample_image_path,
-                    "test-bucket",
-                    key="test-key",
-                    optimize=True,
-                    quality=80,
-                    ctx=mock_ctx
-                )
-                
-                assert isinstance(result, UploadResponse)
-                assert result.success is True
-                assert result.url is not None
-                assert result.key == "test-key"
-                assert result.bucket == "test-bucket"
-                
-                # Verify context calls
-                mock_ctx.info.assert_called()
-                mock_s3_client.upload_file.assert_called_once()
+        result = await upload_image_to_s3(
+            sample_image_path,
+            "test-bucket",
+            key="test-key",
+            optimize=True,
+            quality=80,
+            ctx=mock_ctx
+        )
+        
+        assert isinstance(result, UploadResponse)
+        assert result.success is True
+        assert result.url is not None
+        assert result.key == "test-key"
+        assert result.bucket == "test-bucket"
+        
+        # Verify context calls
+        mock_ctx.info.assert_called()
+        mock_s3_client.upload_bytes.assert_called_once()
+        assert mock_s3_client.upload_bytes.call_args[0][0] == b'optimized image bytes'
+        mock_s3_client.upload_file.assert_not_called()
     
-    @pytest.mark.asyncio
-    async def test_upload_image_to_s3_file_not_found(self, mock_s3_client, mock_image_processor):
+    async def test_upload_image_to_s3_file_not_found(self, mock_ctx, fs_mock, mock_s3_client, mock_image_processor):
         """Test upload with non-existent file."""
-        with patch('os.path.exists', return_value=False):
-            mock_ctx = Mock(spec=Context)
-            mock_ctx.info = AsyncMock()
-            mock_ctx.error = AsyncMock()
-            
-            result = await upload_image_to_s3(
-                "nonexistent.png",
-                "test-bucket",
-                ctx=mock_ctx
-            )
-            
-            assert isinstance(result, UploadResponse)
-            assert result.success is False
-            assert "File not found" in result.error
+        fs_mock["exists"].return_value = False
+        
+        result = await upload_image_to_s3(
+            "nonexistent.png",
+            "test-bucket",
+            ctx=mock_ctx
+        )
+        
+        assert isinstance(result, UploadResponse)
+        assert result.success is False
+        assert "File not found" in result.error
     
-    @pytest.mark.asyncio
-    async def test_upload_image_to_s3_unsupported_format(self, sample_image_path, mock_s3_client, mock_image_processor):
+    async def test_upload_image_to_s3_unsupported_format(self, mock_ctx, fs_mock, sample_image_path, mock_s3_client, mock_image_processor):
         """Test upload with unsupported format."""
         mock_image_processor.is_supported_format.return_value = False
         
-        with patch('os.path.exists', return_value=True):
-            mock_ctx = Mock(spec=Context)
-            mock_ctx.info = AsyncMock()
-            mock_ctx.error = AsyncMock()
-            
-            result = await upload_image_to_s3(
-                sample_image_path,
-                "test-bucket",
-                ctx=mock_ctx
-            )
-            
-            assert isinstance(result, UploadResponse)
-            assert result.success is False
-            assert "Unsupported image format" in result.error
+        result = await upload_image_to_s3(
+            sample_image_path,
+            "test-bucket",
+            ctx=mock_ctx
+        )
+        
+        assert isinstance(result, UploadResponse)
+        assert result.success is False
+        assert "Unsupported image format" in result.error
     
-    @pytest.mark.asyncio
-    async def test_upload_image_to_s3_optimization_failure(self, sample_image_path, mock_s3_client, mock_image_processor):
+    async def test_upload_image_to_s3_optimization_failure(self, mock_ctx, fs_mock, sample_image_path, mock_s3_client, mock_image_processor):
         """Test upload with optimization failure."""
-        mock_image_processor.optimize_image.side_effect = Exception("Optimization failed")
+        mock_image_processor.optimize_image_bytes.side_effect = Exception("Optimization failed")
         
-        with patch('os.path.exists', return_value=True):
-            mock_ctx = Mock(spec=Context)
-            mock_ctx.info = AsyncMock()
-            mock_ctx.warning = AsyncMock()
-            mock_ctx.error = AsyncMock()
-            
-            result = await upload_image_to_s3(
-                sample_image_path,
-                "test-bucket",
-                optimize=True,
-                ctx=mock_ctx
-            )
-            
-            assert isinstance(result, UploadResponse)
-            assert result.success is True  # Should fallback to original file
-            mock_ctx.warning.assert_called()
+        result = await upload_image_to_s3(
+            sample_image_path,
+            "test-bucket",
+            optimize=True,
+            ctx=mock_ctx
+        )
+        
+        assert isinstance(result, UploadResponse)
+        assert result.success is True  # Should fallback to original file
+        mock_ctx.warning.assert_called()
+        mock_s3_client.upload_file.assert_called_once()
+        assert mock_s3_client.upload_file.call_args[0][0] == sample_image_path
     
-    @pytest.mark.asyncio
-    async def test_batch_upload_images_success(self, mock_s3_client, mock_image_processor):
+    async def test_batch_upload_images_success(self, mock_ctx, fs_mock, mock_s3_client, mock_image_processor):
         """Test successful batch upload."""
         file_paths = ["test1.png", "test2.png"]
         
-        with patch('os.path.exists', return_value=True):
-            mock_ctx = Mock(spec=Context)
-            mock_ctx.info = AsyncMock()
-            mock_ctx.warning = AsyncMock()
-            mock_ctx.error = AsyncMock()
-            
+        with patch('s3_upload_mcp.tools._list_directory', return_value=frozenset(file_paths)):
             result = await batch_upload_images(
                 file_paths,
                 "test-bucket",
@@ -139,35 +139,49 @@ class TestMCPTools:
             assert result.successful_uploads == 2
             assert len(result.urls) == 2
             assert len(result.errors) == 0
+            
+            # The first and the final completion are always reported
+            assert mock_ctx.report_progress.await_count == 2
+            mock_ctx.report_progress.assert_awaited_with(2, 2)
     
-    @pytest.mark.asyncio
-    async def test_batch_upload_images_with_errors(self, mock_s3_client, mock_image_processor):
+    async def test_batch_upload_images_throttles_progress(self, mock_ctx, fs_mock, mock_s3_client, mock_image_processor):
+        """Test progress reports within one interval are coalesced."""
+        file_paths = [f"test{i}.png" for i in range(5)]
+        
+        with patch('s3_upload_mcp.tools._list_directory', return_value=frozenset(file_paths)), \
+             patch('s3_upload_mcp.tools.time', Mock(wraps=time, **{'monotonic.return_value': 100.0})):
+            result = await batch_upload_images(
+                file_paths,
+                "test-bucket",
+                optimize=False,
+                ctx=mock_ctx
+            )
+            
+            assert result.successful_uploads == 5
+            assert mock_ctx.report_progress.await_args_list == [call(1, 5), call(5, 5)]
+    
+    async def test_batch_upload_images_progress_failure(self, mock_ctx, fs_mock, mock_s3_client, mock_image_processor):
+        """Test failed progress notifications do not fail finished uploads."""
+        file_paths = ["test1.png", "test2.png"]
+        mock_ctx.report_progress.side_effect = Exception("Session closed")
+        
+        with patch('s3_upload_mcp.tools._list_directory', return_value=frozenset(file_paths)):
+            result = await batch_upload_images(
+                file_paths,
+                "test-bucket",
+                ctx=mock_ctx
+            )
+        
+        assert result.successful_uploads == 2
+        assert result.errors == []
+    
+    async def test_batch_upload_images_with_errors(self, mock_ctx, fs_mock, mock_s3_client, mock_image_processor):
         """Test batch upload with some failures."""
         file_paths = ["test1.png", "nonexistent.png", "test3.png"]
+        fs_mock["exists"].return_value = False
+        mock_s3_client.upload_bytes.side_effect = _upload_results(["test-key-1", "test-key-3"])
         
-        def mock_exists(path):
-            return path != "nonexistent.png"
-        
-        # Mock upload_multiple to return results for 2 files (excluding nonexistent)
-        mock_s3_client.upload_multiple.return_value = [
-            {
-                'success': True,
-                'url': 'https://test-bucket.s3.us-east-1.amazonaws.com/test-key-1',
-                'key': 'test-key-1'
-            },
-            {
-                'success': True,
-                'url': 'https://test-bucket.s3.us-east-1.amazonaws.com/test-key-3',
-                'key': 'test-key-3'
-            }
-        ]
-        
-        with patch('os.path.exists', side_effect=mock_exists):
-            mock_ctx = Mock(spec=Context)
-            mock_ctx.info = AsyncMock()
-            mock_ctx.warning = AsyncMock()
-            mock_ctx.error = AsyncMock()
-            
+        with patch('s3_upload_mcp.tools._list_directory', return_value=frozenset({"test1.png", "test3.png"})):
             result = await batch_upload_images(
                 file_paths,
                 "test-bucket",
@@ -181,18 +195,38 @@ class TestMCPTools:
             assert result.failed_uploads == 1
             assert len(result.errors) == 1
             assert "File not found" in result.errors[0]
+            assert mock_s3_client.upload_bytes.await_count == 2
+            assert sorted(result.urls) == [
+                "https://test-bucket.s3.us-east-1.amazonaws.com/test-key-1",
+                "https://test-bucket.s3.us-east-1.amazonaws.com/test-key-3"
+            ]
     
-    @pytest.mark.asyncio
-    async def test_batch_upload_images_no_valid_files(self, mock_s3_client, mock_image_processor):
+    async def test_batch_upload_images_optimization_failure(self, mock_ctx, fs_mock, mock_s3_client, mock_image_processor):
+        """Test files that fail to optimize are reported and not uploaded."""
+        file_paths = ["test1.png", "test2.png"]
+        mock_image_processor.optimize_image_bytes.side_effect = [
+            Exception("Corrupt image"), b'optimized image bytes'
+        ]
+        
+        with patch('s3_upload_mcp.tools._list_directory', return_value=frozenset(file_paths)):
+            result = await batch_upload_images(
+                file_paths,
+                "test-bucket",
+                max_concurrent=1,
+                ctx=mock_ctx
+            )
+            
+            assert result.successful_uploads == 1
+            assert result.failed_uploads == 1
+            assert result.errors == ["Optimization failed for test1.png: Corrupt image"]
+            mock_s3_client.upload_bytes.assert_awaited_once()
+            mock_image_processor.get_optimization_stats.assert_called_once()
+    
+    async def test_batch_upload_images_no_valid_files(self, mock_ctx, mock_s3_client, mock_image_processor):
         """Test batch upload with no valid files."""
         file_paths = ["nonexistent1.png", "nonexistent2.png"]
         
-        with patch('os.path.exists', return_value=False):
-            mock_ctx = Mock(spec=Context)
-            mock_ctx.info = AsyncMock()
-            mock_ctx.warning = AsyncMock()
-            mock_ctx.error = AsyncMock()
-            
+        with patch('s3_upload_mcp.tools._list_directory', return_value=frozenset()):
             result = await batch_upload_images(
                 file_paths,
                 "test-bucket",
@@ -206,13 +240,70 @@ class TestMCPTools:
             assert result.failed_uploads == 2
             assert len(result.errors) == 2
     
-    @pytest.mark.asyncio
-    async def test_list_s3_buckets_success(self, mock_s3_client):
-        """Test successful bucket listing."""
-        mock_ctx = Mock(spec=Context)
-        mock_ctx.info = AsyncMock()
-        mock_ctx.error = AsyncMock()
+    async def test_batch_upload_images_separate_limits(self, mock_ctx, fs_mock, mock_s3_client, mock_image_processor):
+        """Test optimizations and uploads are limited independently."""
+        file_paths = [f"test{i}.png" for i in range(6)]
+        active = {'optimize': 0, 'upload': 0}
+        peak = {'optimize': 0, 'upload': 0}
+        
+        def tracked(stage, value, delay):
+            async def run(*args, **kwargs):
+                active[stage] += 1
+                peak[stage] = max(peak[stage], active[stage])
+                await asyncio.sleep(delay)
+                active[stage] -= 1
+                return value
+            return run
+        
+        mock_image_processor.optimize_image_bytes.side_effect = tracked('optimize', b'data', 0.005)
+        mock_s3_client.upload_bytes.side_effect = tracked('upload', _upload_results(['key'])[0], 0.05)
+        
+        with patch('s3_upload_mcp.tools._list_directory', return_value=frozenset(file_paths)):
+            result = await batch_upload_images(
+                file_paths,
+                "test-bucket",
+                max_concurrent=3,
+                max_concurrent_optimizations=1,
+                ctx=mock_ctx
+            )
+        
+        assert result.successful_uploads == 6
+        assert peak['optimize'] == 1
+        assert 1 < peak['upload'] <= 3
+    
+    async def test_find_existing(self, sample_image_path):
+        """Test existence checks scan each directory once."""
+        sample_dir = os.path.dirname(sample_image_path)
+        missing_path = os.path.join(sample_dir, "missing.png")
+        other_dir_path = os.path.join(sample_dir, "nonexistent_dir", "image.png")
+        
+        with patch('s3_upload_mcp.tools.os.scandir', wraps=os.scandir) as mock_scandir:
+            existing = await _find_existing([sample_image_path, missing_path, other_dir_path])
+        
+        assert existing == {sample_image_path}
+        assert mock_scandir.call_count == 2
+    
+    async def test_find_existing_falls_back_to_exists(self, fs_mock):
+        """Test names missing from a listing are checked with os.path.exists."""
+        nfc_path = unicodedata.normalize('NFC', "designs/디자인 test.png")
+        nfd_name = unicodedata.normalize('NFD', "디자인 test.png")
+        # A case-insensitive, NFD-normalizing filesystem lists other spellings
+        fs_mock["exists"].side_effect = lambda path: path in {nfc_path, "designs/IMG.PNG"}
+        
+        with patch('s3_upload_mcp.tools._list_directory', return_value=frozenset({nfd_name, "img.png"})):
+            existing = await _find_existing([nfc_path, "designs/IMG.PNG", "designs/missing.png"])
+        
+        assert existing == {nfc_path, "designs/IMG.PNG"}
+    
+    async def test_find_existing_dangling_symlink(self, temp_dir):
+        """Test a symlink to a missing file is not reported as existing."""
+        link_path = os.path.join(temp_dir, "dangling.png")
+        os.symlink(os.path.join(temp_dir, "gone.png"), link_path)
         
+        assert await _find_existing([link_path]) == set()
+    
+    async def test_list_s3_buckets_success(self, mock_ctx, mock_s3_client):
+        """Test successful bucket listing."""
         result = await list_s3_buckets(mock_ctx)
         
         assert isinstance(result, BucketListResponse)
@@ -221,28 +312,18 @@ class TestMCPTools:
         assert result.count == 2
         assert "test-bucket" in result.buckets
     
-    @pytest.mark.asyncio
-    async def test_list_s3_buckets_failure(self, mock_s3_client):
+    async def test_list_s3_buckets_failure(self, mock_ctx, mock_s3_client):
         """Test bucket listing failure."""
         mock_s3_client.list_buckets.side_effect = Exception("AWS error")
         
-        mock_ctx = Mock(spec=Context)
-        mock_ctx.info = AsyncMock()
-        mock_ctx.error = AsyncMock()
-        
         result = await list_s3_buckets(mock_ctx)
         
         assert isinstance(result, BucketListResponse)
         assert result.success is False
         assert "AWS error" in result.error
     
-    @pytest.mark.asyncio
-    async def test_get_server_info_success(self, mock_s3_client):
+    async def test_get_server_info_success(self, mock_ctx, mock_s3_client):
         """Test successful server info retrieval."""
-        mock_ctx = Mock(spec=Context)
-        mock_ctx.info = AsyncMock()
-        mock_ctx.error = AsyncMock()
-        
         result = await get_server_info(mock_ctx)
         
         assert result.name == "S3 Upload MCP Server"
@@ -250,19 +331,26 @@ class TestMCPTools:
         assert result.status == "running"
         assert result.aws_region == "us-east-1"
         assert result.bucket_name == "test-bucket"
+        
+        # Static after startup, so later calls reuse the same response
+        assert await get_server_info(mock_ctx) is result
     
-    @pytest.mark.asyncio
-    async def test_get_server_info_failure(self):
+    async def test_get_server_info_failure(self, mock_ctx):
         """Test server info retrieval with no client."""
-        # Clear global instances
-        set_global_instances(None, None)
-        
-        mock_ctx = Mock(spec=Context)
-        mock_ctx.info = AsyncMock()
-        mock_ctx.error = AsyncMock()
-        
-        result = await get_server_info(mock_ctx)
+        # No services attached
+        with patch('s3_upload_mcp.tools.get_tool_context', return_value=None):
+            result = await get_server_info(mock_ctx)
         
         assert result.status == "running"  # Default status
         assert result.aws_region is None
         assert result.bucket_name is None
+    
+    def test_get_tool_context(self, mock_ctx, mock_s3_client, mock_image_processor):
+        """Test services are read from the server's lifespan context."""
+        tool_context = ToolContext(s3=mock_s3_client, images=mock_image_processor)
+        mock_ctx.lifespan_context = {TOOL_CONTEXT_KEY: tool_context}
+        
+        assert get_tool_context(mock_ctx) is tool_context
+        
+        mock_ctx.lifespan_context = {}
+        assert get_tool_context(mock_ctx) is None
@@ -0,0 +1,114 @@
+"""
+Unit tests for shared utilities
+"""
+
+import asyncio
+import pytest
+from pathlib import Path
+from s3_upload_mcp.utils import bounded_map, bytes_digest, file_digest, file_suffix
+
+
+class TestUtils:
+    """Test cases for utility helpers."""
+    
+    @pytest.mark.parametrize("file_path", [
+        "image.png", "IMAGE.JPG", "/a.b/image", "image", ".png", "..png",
+        "image.", "archive.tar.gz", "dir/.hidden.webp", "dir/"
+    ])
+    def test_file_suffix_matches_pathlib(self, file_path):
+        """Test suffixes match Path(...).suffix.lower()."""
+        assert file_suffix(file_path) == Path(file_path).suffix.lower()
+    
+    def test_file_digest(self, sample_image_path):
+        """Test content digests are stable and salted."""
+        digest = file_digest(sample_image_path)
+        
+        assert digest == file_digest(sample_image_path)
+        assert digest != file_digest(sample_image_path, 80)
+        assert len(digest) == 32
+    
+    def test_digest_salt_values_do_not_run_together(self):
+        """Test salts whose values concatenate to the same text differ."""
+        digests = {
+            bytes_digest(b'image', 80, 1920, 1080, False),
+            bytes_digest(b'image', 80, 19, 201080, False),
+            bytes_digest(b'image', 801, 920, 1080, False),
+            bytes_digest(b'image', '80', 1920, 1080, False),
+        }
+        
+        assert len(digests) == 4
+    
+    def test_bytes_digest_matches_file_digest(self, sample_image_path):
+        """Test in-memory and on-disk content hash identically."""
+        with open(sample_image_path, 'rb') as f:
+            data = f.read()
+        
+        assert bytes_digest(data) == file_digest(sample_image_path)
+        assert bytes_digest(data, 80) == file_digest(sample_image_path, 80)
+    
+    async def test_bounded_map_preserves_order(self):
+        """Test results come back in input order."""
+        async def double(value):
+            await asyncio.sleep(0.001 * (5 - value))
+            return value * 2
+        
+        results = await bounded_map(double, range(5), max_concurrent=3)
+        
+        assert results == [0, 2, 4, 6, 8]
+    
+    async def test_bounded_map_limits_concurrency(self):
+        """Test no more than max_concurrent calls run at once."""
+        running = 0
+        peak = 0
+        
+        async def track(value):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.001)
+            running -= 1
+            return value
+        
+        await bounded_map(track, range(20), max_concurrent=4)
+        
+        assert peak == 4
+    
+    async def test_bounded_map_returns_exceptions(self):
+        """Test exceptions are returned in place of results."""
+        async def fail_on_odd(value):
+            if value % 2:
+                raise ValueError(f"odd: {value}")
+            return value
+        
+        results = await bounded_map(fail_on_odd, range(3), max_concurrent=2)
+        
+        assert results[0] == 0
+        assert isinstance(results[1], ValueError)
+        assert results[2] == 2
+    
+    async def test_bounded_map_empty(self):
+        """Test an empty input returns an empty list."""
+        async def identity(value):
+            return value
+        
+        assert await bounded_map(identity, [], max_concurrent=3) == []
+    
+    async def test_bounded_map_async_iterable(self):
+        """Test async iterables are consumed lazily, in order."""
+        produced = []
+        
+        async def generate():
+            for value in range(10):
+                produced.append(value)
+                yield value
+        
+        async def check_backlog(value):
+            # Never more than the queue (2 * max_concurrent) plus the
+            # items held by workers is pulled ahead of the consumer
+            assert len(produced) - value <= 2 * 2 + 2
+            await asyncio.sleep(0)
+            return value
+        
+        results = await bounded_map(check_backlog, generate(), max_concurrent=2)
+        
+        assert results == list(range(10))